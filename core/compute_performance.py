@@ -3,9 +3,135 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
-import plotly.graph_objects as go
 from strategies.base import BaseStrategy
+from utils.plotting import lttb_indices, resample_ohlc, figure_key
+
+
+def batch_statistics(values, positions=None, fees=0, risk_free_rate=0, index=None, symbols=None):
+    """
+    Statistiques de compute_statistics pour plusieurs courbes à la fois, sans
+    DataFrame par courbe.
+    values : (runs x dates) valeurs du portefeuille
+    positions : (runs x dates x actifs) valeurs des positions, pour la diversification
+    symbols : noms des actifs de positions (une liste, ou une liste par run)
+    fees : frais totaux, scalaire ou un par run
+    Retourne un DataFrame (runs x statistiques), mêmes colonnes et arrondis que compute_statistics.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    n_dates = values.shape[1]
+    returns = values[:, 1:] / values[:, :-1] - 1
+    total_return = np.prod(1 + returns, axis=1) - 1
+    annualized_return = (1 + total_return) ** (252 / n_dates) - 1
+    annualized_volatility = returns.std(axis=1, ddof=1) * np.sqrt(252)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(
+            annualized_volatility > 0,
+            (annualized_return - risk_free_rate) / annualized_volatility,
+            np.nan
+        )
+    drawdown = values / np.maximum.accumulate(values, axis=1) - 1
+    max_drawdown = drawdown.min(axis=1)
+    fees = np.broadcast_to(np.asarray(fees, dtype=np.float64), len(values))
+    total_fees = fees / (values[:, -1] + fees) * 100
+    stats = {
+        "Annualized Return (%)": np.round(annualized_return * 100, 2),
+        "Annualized Volatility (%)": np.round(annualized_volatility * 100, 2),
+        "Sharpe Ratio": np.round(sharpe, 2),
+        "Max Drawdown (%)": np.round(max_drawdown * 100, 2),
+        "Total Return (%)": np.round(total_return * 100, 2),
+        "Frais (%)": np.round(total_fees, 2),
+    }
+    if positions is not None:
+        stats["Diversification"] = np.round(batch_diversification(positions, symbols), 2)
+    return pd.DataFrame(stats, index=index)
+
+
+def batch_diversification(positions, symbols=None):
+    """
+    Même mesure que diversification_effective : 1 / (n * Herfindahl) moyen, n = actifs non
+    nuls du run. symbols : noms des actifs (une liste, ou une liste par run) ; comme dans
+    diversification_effective, seules les colonnes de tickers alphabétiques en majuscules comptent.
+    """
+    weights = np.abs(np.asarray(positions, dtype=np.float64))
+    if symbols is not None:
+        symbols = [symbols] if isinstance(symbols[0], str) else symbols
+        keep = np.array([[s.isalpha() and s.upper() == s for s in run] for run in symbols])
+        weights = np.where(keep[:, None, :], weights, 0.0)
+    n_assets = (weights != 0).any(axis=1).sum(axis=1)
+    # NaN ignorés dans la somme, comme DataFrame.sum
+    gross = np.nansum(weights, axis=2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        weights = weights / gross[..., None]
+        # dates avec un poids NaN (position manquante ou aucune position) écartées, comme le dropna
+        rows = ~np.isnan(weights).any(axis=2)
+        h = (weights ** 2).sum(axis=2) / weights.sum(axis=2) ** 2
+        inverse = 1 / (n_assets[:, None] * h)
+        # moyenne hors NaN, comme Series.mean
+        valid = rows & ~np.isnan(inverse)
+        return np.where(valid, inverse, 0).sum(axis=1) / valid.sum(axis=1)
+
+
+def batch_xirr(times, amounts, tol=1e-10, max_iter=100):
+    """
+    TRI (XIRR) de plusieurs échéanciers à la fois.
+    times : (échéanciers x flux) années depuis le premier flux (jours / 365)
+    amounts : (échéanciers x flux) montants, 0 pour compléter les échéanciers plus courts
+    Newton sur x = ln(1 + taux), protégé par un encadrement [bas, haut] : un pas qui sort
+    de l'encadrement est remplacé par une bissection, la convergence est donc garantie.
+    Retourne un tableau de taux (NaN si aucun changement de signe n'est trouvé).
+    """
+    times = np.atleast_2d(np.asarray(times, dtype=np.float64))
+    amounts = np.atleast_2d(np.asarray(amounts, dtype=np.float64))
+
+    def npv(x, rows=slice(None)):
+        t, cf = times[rows], amounts[rows]
+        with np.errstate(over="ignore", invalid="ignore"):
+            discount = np.exp(-x[:, None] * t)
+            return (cf * discount).sum(axis=1), -(cf * t * discount).sum(axis=1)
+
+    # encadrement de départ : taux de -99 % à +1000 %, élargi vers le haut si besoin
+    lo = np.full(len(times), np.log(0.01))
+    hi = np.full(len(times), np.log(11.0))
+    f_lo, _ = npv(lo)
+    f_hi, _ = npv(hi)
+    for _ in range(10):
+        widen = np.sign(f_lo) == np.sign(f_hi)
+        if not widen.any():
+            break
+        hi = np.where(widen, hi + 2, hi)
+        f_hi[widen] = npv(hi[widen], widen)[0]
+    bracketed = np.sign(f_lo) != np.sign(f_hi)
+
+    x = np.where(bracketed, np.log(1.1), np.nan)
+    x = np.clip(x, lo, hi)
+    active = bracketed.copy()
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        f, f_prime = npv(x[active], active)
+        # resserre l'encadrement avec le point courant
+        same_as_lo = np.sign(f) == np.sign(f_lo[active])
+        lo[active] = np.where(same_as_lo, x[active], lo[active])
+        f_lo[active] = np.where(same_as_lo, f, f_lo[active])
+        hi[active] = np.where(same_as_lo, hi[active], x[active])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = x[active] - f / f_prime
+        inside = (newton > lo[active]) & (newton < hi[active]) & np.isfinite(newton)
+        step = np.where(inside, newton, (lo[active] + hi[active]) / 2)
+        done = (np.abs(step - x[active]) < tol) | (f == 0)
+        x[active] = step
+        active[np.flatnonzero(active)[done]] = False
+    return np.expm1(x)
+
+
+def xirr(dates, amounts):
+    """ TRI d'un seul échéancier (dates, montants). """
+    dates = pd.DatetimeIndex(dates)
+    times = (dates - dates[0]).days.to_numpy() / 365
+    return float(batch_xirr(times, amounts)[0])
+
 
 class PerformanceAnalyzer(BaseStrategy):
     def __init__(self, data_handler, portfolio_df: pd.DataFrame, orders: dict, strategy):
@@ -46,7 +172,7 @@ class PerformanceAnalyzer(BaseStrategy):
         return self.stats
 
     def diversification_effective(self):
-        df = self.df.copy()
+        df = self.df
         asset_symbols = [
             col for col in df.columns
             if col.isalpha() and col.upper() == col and not (df[col] == 0).all()
@@ -60,8 +186,7 @@ class PerformanceAnalyzer(BaseStrategy):
         return (1 / (n * h_series)).mean()
     
     def compute_fees(self, fees):
-        df = self.df.copy()
-        net_value = df["value"].iloc[-1]
+        net_value = self.df["value"].iloc[-1]
         total_fees = (fees / (net_value + fees))*100
         return total_fees
         
@@ -88,32 +213,37 @@ class PerformanceAnalyzer(BaseStrategy):
         return self.stats
 
     def xirr(self, cash_flows):
-        def xnpv(rate):
-            return sum([cf / (1 + rate) ** ((d - cash_flows[0][0]).days / 365) for d, cf in cash_flows])
-        def xirr_newton():
-            rate = 0.1
-            for _ in range(100):
-                f = xnpv(rate)
-                f_prime = sum([
-                    - (d - cash_flows[0][0]).days / 365 * cf / (1 + rate) ** (((d - cash_flows[0][0]).days / 365) + 1)
-                    for d, cf in cash_flows
-                ])
-                rate -= f / f_prime
-                if abs(f) < 1e-6:
-                    return rate
-            return rate
-        return xirr_newton()
+        dates, amounts = zip(*cash_flows)
+        return xirr(dates, amounts)
     
     def get_dataframe(self):
         return self.df
     
     
-    def plot(self, benchmark=None):
-        df = self.df.copy()
+    def plot(self, benchmark=None, max_points=None, use_cache=True):
+        """
+        Figure Plotly du backtest (valeur, poids, chandeliers + ordres par actif).
+        Les courbes sont réduites à `max_points` points (LTTB), les chandeliers passent en
+        hebdomadaire / mensuel sur les longs historiques, les ordres sont regroupés en une
+        trace par actif et par action. La figure est mise en cache sur disque par empreinte du run.
+        """
+        df = self.df
+        max_points = max_points or self.general_config.get("plot_max_points", 2000)
         asset_symbols = [
             col for col in df.columns
             if col.isalpha() and col.upper() == col and not (df[col] == 0).all()
         ]
+        cache_path = None
+        if use_cache and self.strategy is not None:
+            key = figure_key(
+                df[["value"] + asset_symbols], benchmark, sorted((str(d), o) for d, o in self.orders.items()),
+                max_points, getattr(self.data_handler, "data_path", None), getattr(self.data_handler, "mtime", None),
+            )
+            cache_path = f"output/{self.strategy.name}/plot_cache/{key}.json"
+            if os.path.exists(cache_path):
+                os.utime(cache_path)  # date d'accès pour l'éviction
+                return pio.read_json(cache_path)
+
         n_assets = len(asset_symbols)
         total_rows = 2 + n_assets
         if n_assets > 0:
@@ -129,7 +259,9 @@ class PerformanceAnalyzer(BaseStrategy):
         specs = [[{}] for _ in range(total_rows)]
         for j in range(2, total_rows):
             specs[j] = [{'secondary_y': True}]
-        portfolio = df["value"]
+        # mêmes points retenus pour la valeur, le benchmark et les poids (axe x commun)
+        keep = df.index[lttb_indices(df["value"].to_numpy(), max_points)]
+        portfolio = df["value"].loc[keep]
         fig = make_subplots(
             rows=total_rows,
             cols=1,
@@ -141,16 +273,17 @@ class PerformanceAnalyzer(BaseStrategy):
         )
         fig.add_trace(
             go.Scatter(
-                x=df.index,
+                x=keep,
                 y=portfolio,
                 name="Portfolio ($)",
                 line=dict(color='green')
             ), row=1, col=1
         )
         if benchmark is not None:
+            benchmark = benchmark.reindex(keep)
             fig.add_trace(
                 go.Scatter(
-                    x=df.index,
+                    x=keep,
                     y=benchmark,
                     name="Benchmark ($)",
                     line=dict(color='navy')
@@ -158,14 +291,14 @@ class PerformanceAnalyzer(BaseStrategy):
             )
             self.add_performance_fill(
                 fig=fig,
-                x=df.index,
+                x=keep,
                 portfolio=portfolio,
                 benchmark=benchmark,
                 row=1,
                 col=1
             )
-        gross_value = df[asset_symbols].abs().sum(axis=1)
-        df_weights = df[asset_symbols].abs().div(gross_value, axis=0)
+        gross_value = df[asset_symbols].loc[keep].abs().sum(axis=1)
+        df_weights = df[asset_symbols].loc[keep].abs().div(gross_value, axis=0)
         for sym in asset_symbols:
             fig.add_trace(
                 go.Scatter(
@@ -178,8 +311,15 @@ class PerformanceAnalyzer(BaseStrategy):
                 ), row=2, col=1
             )
 
+        markers = {
+            "buy": dict(symbol="triangle-up", color="green", size=12),
+            "sell": dict(symbol="triangle-down", color="red", size=12),
+            "exit": dict(symbol="diamond", color="purple", size=10),
+            "deposit": dict(symbol="diamond", color="blue", size=10),
+        }
         for i, sym in enumerate(asset_symbols):
-            ohlc = self.data_handler.get(sym).reindex(df.index)
+            ohlc_daily = self.data_handler.get(sym).reindex(df.index)
+            ohlc = resample_ohlc(ohlc_daily, max_points)
             fig.add_trace(
                 go.Candlestick(
                     x=ohlc.index,
@@ -203,41 +343,31 @@ class PerformanceAnalyzer(BaseStrategy):
                     ), row=3+i, col=1, secondary_y=True
                 )
             fig.update_xaxes(rangeslider_visible=False, row=3+i, col=1)
-            fig.update_yaxes(
-                range=[0, ohlc['Volume'].max() * 2],
-                row=3+i, col=1,
-                secondary_y=True
-            )
+            if 'Volume' in ohlc.columns:
+                fig.update_yaxes(
+                    range=[0, ohlc['Volume'].max() * 2],
+                    row=3+i, col=1,
+                    secondary_y=True
+                )
 
+            # une trace par action (au lieu d'une par ordre), au prix de clôture du jour
+            points = {}
             for timestamp, order_list in self.orders.items():
                 for order in order_list:
-                    if order["symbol"] != sym:
-                        continue
-                    base_price = ohlc.loc[timestamp, "Close"]
-                    if order["action"] == "buy":
-                        marker = dict(symbol="triangle-up", color="green", size=12)
-                        price = base_price * 1
-                    elif order["action"] == "sell":
-                        marker = dict(symbol="triangle-down", color="red", size=12)
-                        price = base_price * 1
-                    elif order["action"] == "exit":
-                        marker = dict(symbol="diamond", color="purple", size=10)
-                        price = base_price
-                    elif order["action"] == "deposit":
-                        marker = dict(symbol="diamond", color="blue", size=10)
-                        price = base_price
-                    else:
-                        continue
-                    fig.add_trace(
-                        go.Scatter(
-                            x=[timestamp],
-                            y=[price],
-                            mode="markers",
-                            marker=marker,
-                            name=f"{sym} - {order['action']}",
-                            showlegend=False
-                        ), row=3+i, col=1
-                    )
+                    if order["symbol"] == sym and order["action"] in markers:
+                        points.setdefault(order["action"], []).append(timestamp)
+            for action, timestamps in points.items():
+                prices = ohlc_daily["Close"].reindex(pd.DatetimeIndex(timestamps))
+                fig.add_trace(
+                    go.Scatter(
+                        x=prices.index,
+                        y=prices.to_numpy(),
+                        mode="markers",
+                        marker=markers[action],
+                        name=f"{sym} - {action}",
+                        showlegend=False
+                    ), row=3+i, col=1
+                )
 
         fig.update_layout(
             height=800 + 250 * n_assets,
@@ -250,41 +380,49 @@ class PerformanceAnalyzer(BaseStrategy):
         for r in range(1, total_rows):
             fig.update_xaxes(showticklabels=False, row=r, col=1)
 
+        if cache_path is not None:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            fig.write_json(cache_path)
+            # seules les plot_cache_size figures les plus récemment utilisées sont gardées
+            cache_dir = os.path.dirname(cache_path)
+            figures = sorted((os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".json")),
+                             key=os.path.getmtime, reverse=True)
+            for path in figures[self.general_config.get("plot_cache_size", 8):]:
+                os.remove(path)
         # fig.write_html(f"output/{self.strategy.name}/portfolio_plot.html", auto_open=True)
+        return fig
 
 
     def add_performance_fill(self, fig, x, portfolio, benchmark, row, col):
+        # un seul polygone par couleur : les segments sont concaténés, séparés par None
         portfolio, benchmark = portfolio.align(benchmark, join='inner')
         mask = portfolio > benchmark
         segments = (mask != mask.shift()).cumsum()
+        polygons = {True: ([], []), False: ([], [])}
 
         for seg_id in segments.unique():
             segment_mask = segments == seg_id
             p_seg = portfolio[segment_mask]
             b_seg = benchmark[segment_mask]
-            x_seg = x[segment_mask]
 
             if len(p_seg) < 2:
                 continue  # skip too short
 
-            color = 'rgba(0,255,0,0.3)' if (p_seg > b_seg).iloc[0] else 'rgba(255,0,0,0.3)'
-
-            # Upper curve
-            fig.add_trace(go.Scatter(
-                x=x_seg,
-                y=p_seg,
-                mode='lines',
-                line=dict(width=0),
-                showlegend=False
-            ), row=row, col=col)
+            xs, ys = polygons[bool((p_seg > b_seg).iloc[0])]
+            xs.extend(list(p_seg.index) + list(b_seg.index[::-1]) + [None])
+            ys.extend(list(p_seg.to_numpy()) + list(b_seg.to_numpy()[::-1]) + [None])
 
-            # Lower curve + fill
+        for above, color in ((True, 'rgba(0,255,0,0.3)'), (False, 'rgba(255,0,0,0.3)')):
+            xs, ys = polygons[above]
+            if not xs:
+                continue
             fig.add_trace(go.Scatter(
-                x=x_seg,
-                y=b_seg,
+                x=xs,
+                y=ys,
                 mode='lines',
-                fill='tonexty',
+                fill='toself',
                 fillcolor=color,
                 line=dict(width=0),
+                hoverinfo='skip',
                 showlegend=False
             ), row=row, col=col)
@@ -1,3 +1,5 @@
+import numpy as np
+import pandas as pd
 from strategies.base import BaseStrategy
 
 class OrderExecutor(BaseStrategy):
@@ -6,30 +8,101 @@ class OrderExecutor(BaseStrategy):
         self.slippage_pct = self.general_config["slippage"]
         self.fee_pct = self.general_config["fee_rate"]
         self.data_handler = data_handler
+        self._price_cache = {}
 
     def execute(self, orders, date, order_time='Open'):
-        executed = {date: []}
-        for order in orders:
-            symbol = order['symbol']
-            action = order['action']
-            size = order['size']
-
-            try:
-                price = self.data_handler.get(symbol, price=order_time).loc[date]
-            except KeyError:
-                continue
-
-            slippage = price * self.slippage_pct
-            executed_price = price + slippage if action == 'buy' else price - slippage
-            fee = executed_price * abs(size) * self.fee_pct
-            cost = executed_price * size + (fee if action == 'buy' else -fee)
+        executed, _ = self.execute_batch({date: orders}, dates=[date], order_time=order_time)
+        return executed
+
+    def execute_batch(self, orders, dates=None, order_time='Open'):
+        """
+        Exécute tous les ordres d'un backtest ({date: [ordres]}) en une passe.
+        Retourne le même dict {date: [ordres exécutés]} que execute, pour chaque date
+        de `dates` (par défaut les dates des ordres), et la table des trades en colonnes.
+        """
+        if dates is None:
+            dates = sorted(orders)
+        executed = {date: [] for date in dates}
+        flat = [(date, order) for date in dates for order in orders.get(date, [])]
+        if not flat:
+            return executed, self._trades_table([], [], [], [], [], [], [])
+
+        order_dates = pd.DatetimeIndex([date for date, _ in flat])
+        symbols = [order['symbol'] for _, order in flat]
+        actions = np.array([order['action'] for _, order in flat])
+        sizes = np.array([order['size'] for _, order in flat], dtype=np.float64)
+
+        columns = list(dict.fromkeys(symbols))
+        index, matrix, available = self._price_matrix(tuple(columns), order_time)
+        rows = index.get_indexer(order_dates)
+        position = {s: j for j, s in enumerate(columns)}
+        cols = np.array([position[s] for s in symbols])
+        # ordres sans prix (date absente ou champ manquant) ignorés, comme le KeyError de la version unitaire
+        valid = (rows >= 0) & available[cols]
+        price = matrix[np.where(valid, rows, 0), cols]
 
+        buy = actions == 'buy'
+        slippage = price * self.slippage_pct
+        executed_price = np.where(buy, price + slippage, price - slippage)
+        fee = executed_price * np.abs(sizes) * self.fee_pct
+        cost = executed_price * sizes + np.where(buy, fee, -fee)
+
+        executed_price = np.round(executed_price, 2)
+        cost = np.round(cost, 2)
+        fee = np.round(fee, 3)
+        for i in np.flatnonzero(valid):
+            date, order = flat[i]
             executed[date].append({
-                'symbol': symbol,
-                'action': action,
-                'size': size,
-                'price': round(executed_price, 2),
-                'cost': round(cost, 2),
-                'fee': round(fee, 3)
+                'symbol': order['symbol'],
+                'action': order['action'],
+                'size': order['size'],
+                'price': executed_price[i],
+                'cost': cost[i],
+                'fee': fee[i]
             })
-        return executed
+        trades = self._trades_table(
+            order_dates[valid], np.array(symbols, dtype=object)[valid], actions[valid],
+            sizes[valid], executed_price[valid], cost[valid], fee[valid]
+        )
+        return executed, trades
+
+    def _price_matrix(self, symbols, order_time):
+        # une matrice (dates x univers) par order_time, complétée à l'arrivée de nouveaux
+        # symboles ; chaque appel en extrait les colonnes demandées
+        index, columns, matrix, available = self._price_cache.get(
+            order_time, (pd.DatetimeIndex([]), {}, np.empty((0, 0)), np.empty(0, dtype=bool)))
+        new = [symbol for symbol in symbols if symbol not in columns]
+        if new:
+            series = {}
+            for symbol in new:
+                try:
+                    series[symbol] = self.data_handler.get(symbol, price=order_time)
+                except KeyError:
+                    series[symbol] = None
+            found = [s for s in series.values() if s is not None]
+            if not len(index) and found:
+                # premier symbole trouvé : les colonnes déjà connues sont toutes sans prix
+                index = found[0].index
+                matrix = np.full((len(index), len(columns)), np.nan)
+            added = np.full((len(index), len(new)), np.nan)
+            for j, symbol in enumerate(new):
+                if series[symbol] is not None:
+                    added[:, j] = series[symbol].reindex(index).to_numpy()
+                columns[symbol] = len(columns)
+            matrix = np.hstack([matrix, added])
+            available = np.concatenate([available, [series[s] is not None for s in new]])
+            self._price_cache[order_time] = (index, columns, matrix, available)
+        cols = [columns[symbol] for symbol in symbols]
+        return index, matrix[:, cols], available[cols]
+
+    @staticmethod
+    def _trades_table(dates, symbols, actions, sizes, prices, costs, fees):
+        return pd.DataFrame({
+            'date': dates,
+            'symbol': symbols,
+            'action': actions,
+            'size': sizes,
+            'price': prices,
+            'cost': costs,
+            'fee': fees,
+        })
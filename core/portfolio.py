@@ -1,8 +1,9 @@
+import numpy as np
 import pandas as pd
 from strategies.base import BaseStrategy
 
 class Portfolio(BaseStrategy):
-    def __init__(self, symbols, data_handler, strategy):
+    def __init__(self, symbols, data_handler, strategy, engine=None):
         super().__init__()
         self.cash = self.capital
         self.value = self.cash
@@ -11,9 +12,42 @@ class Portfolio(BaseStrategy):
         self.data_handler = data_handler
         self.strategy = strategy
         self.history = []
+        # "loop" : valorisation à chaque update (portfolio.value à jour pendant le backtest)
+        # "vectorized" : les updates sont enregistrés, la courbe est calculée d'un bloc dans get_history
+        self.engine = engine or self.general_config.get("portfolio_engine", "loop")
+        self._dates = []
+        self._executed = {}
 
     def update(self, date, executed_orders):
-        for order in executed_orders[date]:
+        if self.engine == "vectorized":
+            self._dates.append(date)
+            self._executed[date] = executed_orders[date]
+            return
+        self._apply_orders(executed_orders[date])
+        value = self.cash
+        position_values = {}
+
+        for symbol in self.symbols:
+            price = self.data_handler.get(symbol).loc[[date]]
+            if 'Adj Close' in price.columns:
+                pos_value = self.position_qty[f"{symbol}_qty"] * price['Adj Close'].iloc[-1]
+            else:
+                pos_value = self.position_qty[f"{symbol}_qty"] * price['Close'].iloc[-1]
+            value += pos_value
+            position_values[symbol] = round(pos_value, 2)
+            self.value = value
+
+
+        self.history.append({
+            'date': date,
+            'cash': round(self.cash, 2),
+            'value': round(value, 2),
+            **self.position_qty,
+            **position_values,
+        })
+
+    def _apply_orders(self, orders):
+        for order in orders:
             symbol = order['symbol']
             action = order['action']
             size = order['size']
@@ -32,29 +66,96 @@ class Portfolio(BaseStrategy):
                 self.position_qty[f"{symbol}_qty"] = 0
             elif action == 'deposit':
                 self.position_qty[f"{symbol}_qty"] += size
-        value = self.cash
-        position_values = {}
 
-        for symbol in self.symbols:
-            price = self.data_handler.get(symbol).loc[[date]]
-            if 'Adj Close' in price.columns:
-                pos_value = self.position_qty[f"{symbol}_qty"] * price['Adj Close'].iloc[-1]
-            else:
-                pos_value = self.position_qty[f"{symbol}_qty"] * price['Close'].iloc[-1]
-            value += pos_value
-            position_values[symbol] = round(pos_value, 2)
-            self.value = value
+    def run(self, dates, executed_orders):
+        """
+        Calcule toute la courbe d'un coup à partir des ordres exécutés
+        ({date: [ordres]}) sur les dates de valorisation `dates`.
+        """
+        self.engine = "vectorized"
+        self._dates = list(dates)
+        self._executed = executed_orders
+        return self.get_history()
 
+    def _vectorized_history(self):
+        dates = pd.DatetimeIndex(self._dates)
+        n_dates, n_symbols = len(dates), len(self.symbols)
+        qty_keys = [f"{symbol}_qty" for symbol in self.symbols]
 
-        self.history.append({
-            'date': date,
-            'cash': round(self.cash, 2),
-            'value': round(value, 2),
-            **self.position_qty,
-            **position_values,  
-        })
+        # Les ordres sont rares : on rejoue uniquement les dates qui en ont (un exit dépend
+        # de la quantité courante), puis l'état est propagé aux autres dates en bloc.
+        self.cash = self.capital
+        self.position_qty = {key: 0 for key in qty_keys}
+        has_orders = np.zeros(n_dates, dtype=bool)
+        cash_at = np.zeros(n_dates)
+        qty_at = np.zeros((n_dates, n_symbols))
+        integer_qty = np.ones(n_symbols, dtype=bool)
+        for i, date in enumerate(dates):
+            orders = self._executed.get(date, [])
+            if not orders:
+                continue
+            self._apply_orders(orders)
+            has_orders[i] = True
+            cash_at[i] = self.cash
+            for j, key in enumerate(qty_keys):
+                qty = self.position_qty[key]
+                qty_at[i, j] = qty
+                integer_qty[j] &= isinstance(qty, (int, np.integer))
+
+        # forward-fill via l'indice de la dernière date avec ordres
+        last = np.maximum.accumulate(np.where(has_orders, np.arange(n_dates), -1))
+        cash = np.where(last >= 0, cash_at[np.maximum(last, 0)], self.capital)
+        qty = np.where((last >= 0)[:, None], qty_at[np.maximum(last, 0)], 0.0)
+
+        closes = np.empty((n_dates, n_symbols))
+        for j, symbol in enumerate(self.symbols):
+            field = 'Adj Close' if 'Adj Close' in self.data_handler.get(symbol).columns else 'Close'
+            closes[:, j] = self.data_handler.get(symbol, price=field).loc[dates].to_numpy()
+
+        position_values = qty * closes
+        # même ordre d'accumulation que la boucle (cash + pos_1 + pos_2 ...) pour des arrondis identiques
+        value = cash.copy()
+        for j in range(n_symbols):
+            value += position_values[:, j]
+
+        if n_dates:
+            self.value = value[-1]
+        columns = {'cash': np.round(cash, 2), 'value': np.round(value, 2)}
+        for j, key in enumerate(qty_keys):
+            columns[key] = qty[:, j].astype(np.int64) if integer_qty[j] else qty[:, j]
+        for j, symbol in enumerate(self.symbols):
+            columns[symbol] = np.round(position_values[:, j], 2)
+        return pd.DataFrame(columns, index=pd.Index(dates, name='date'))
+
+    def stitch(self, histories):
+        """
+        Enchaîne les historiques de backtests successifs (folds hors échantillon d'un
+        walk-forward). Chaque fold part du capital initial : ses montants sont remis à
+        l'échelle de la valeur finale du fold précédent, les quantités restent telles quelles.
+        """
+        parts = []
+        scale = 1.0
+        for history in histories:
+            if history.empty:
+                continue
+            part = history.copy()
+            money = ['cash', 'value'] + [symbol for symbol in self.symbols if symbol in part.columns]
+            part[money] = (part[money] * scale).round(2)
+            scale = part['value'].iloc[-1] / self.capital
+            parts.append(part)
+        portfolio = pd.concat(parts).sort_index()
+        portfolio = portfolio[~portfolio.index.duplicated(keep='last')].fillna(0)
+        portfolio.index.name = 'date'
+        self.value = portfolio['value'].iloc[-1]
+        if getattr(self.strategy, "save_outputs", True):
+            portfolio.to_csv(f'output/{self.strategy.name}/walk_forward_portfolio.csv')
+        return portfolio
 
     def get_history(self):
-        portfolio = pd.DataFrame(self.history).set_index('date')
-        portfolio.to_csv(f'output/{self.strategy.name}/portfolio.csv')
-        return portfolio
\ No newline at end of file
+        if self.engine == "vectorized":
+            portfolio = self._vectorized_history()
+        else:
+            portfolio = pd.DataFrame(self.history).set_index('date')
+        if getattr(self.strategy, "save_outputs", True):
+            portfolio.to_csv(f'output/{self.strategy.name}/portfolio.csv')
+        return portfolio
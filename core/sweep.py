@@ -0,0 +1,138 @@
+import itertools
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tqdm import tqdm
+from utils.data_handler import DataHandler, register_data_handler
+from utils.price_store import SharedPriceStore
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+
+def _init_worker(spec, data_path):
+    # toutes les stratégies du worker passent par get_data_handler(data_path) : on y
+    # enregistre le store partagé, les prix ne sont ni relus ni picklés par run
+    register_data_handler(data_path, DataHandler.from_store(SharedPriceStore(*spec)))
+
+
+def _run_one(strategy_cls, strategy_args, params, period=None):
+    try:
+        strategy = strategy_cls(*strategy_args, params=params, save_outputs=False, period=period)
+        return {**params, **strategy.backtest_statistics(), "error": None}
+    except Exception as e:
+        return {**params, "error": repr(e)}
+
+
+def strategy_symbols(strategy):
+    symbols = (
+        getattr(strategy, "pair", None)
+        or getattr(strategy, "assets", None)
+        or list(strategy.assets_dict)
+    )
+    return list(symbols)
+
+
+def _key(values):
+    # 2 et 2.0 (relu depuis le CSV) désignent la même combinaison
+    key = []
+    for v in values:
+        try:
+            key.append(float(v))
+        except (TypeError, ValueError):
+            key.append(str(v))
+    return tuple(key)
+
+
+class ParameterSweep:
+    """
+    Balayage de paramètres (grille ou tirage aléatoire) pour une stratégie qui accepte
+    `params` / `save_outputs` et expose backtest_statistics().
+
+        sweep = ParameterSweep(PairsTradingStrategy, (("AVB", "CPT"),),
+                               grid={"window": [126, 252], "z_enter": [1.5, 2, 2.5], "z_exit": [0.5, 1]})
+        results = sweep.run()
+
+    Les runs sont répartis sur un pool de process qui partagent un seul jeu de prix en
+    mémoire partagée. Chaque résultat est ajouté au fichier `checkpoint` dès qu'il arrive ;
+    relancer le même sweep saute les combinaisons déjà présentes.
+    """
+
+    def __init__(self, strategy_cls, strategy_args=(), grid=None, n_random=None, seed=0,
+                 workers=None, checkpoint=None):
+        self.strategy_cls = strategy_cls
+        self.strategy_args = tuple(strategy_args)
+        self.grid = grid or {}
+        self.n_random = n_random
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        self.checkpoint = checkpoint
+
+    def combinations(self):
+        keys = list(self.grid)
+        combos = [dict(zip(keys, values)) for values in itertools.product(*self.grid.values())]
+        if self.n_random is not None and self.n_random < len(combos):
+            rng = np.random.default_rng(self.seed)
+            combos = [combos[i] for i in sorted(rng.choice(len(combos), self.n_random, replace=False))]
+        return combos
+
+    def _load_checkpoint(self):
+        if self.checkpoint and os.path.exists(self.checkpoint):
+            return pd.read_csv(self.checkpoint)
+        return pd.DataFrame()
+
+    def _done(self, previous):
+        if previous.empty:
+            return set()
+        return {_key(row) for row in previous[list(self.grid)].itertuples(index=False)}
+
+    def _append_checkpoint(self, row):
+        if not self.checkpoint:
+            return
+        os.makedirs(os.path.dirname(self.checkpoint) or ".", exist_ok=True)
+        frame = pd.DataFrame([row])
+        if not os.path.exists(self.checkpoint):
+            frame.to_csv(self.checkpoint, index=False)
+            return
+        # toutes les lignes ont les colonnes de l'en-tête (statistiques vides pour une erreur) ;
+        # une ligne qui en apporte de nouvelles (premier succès après des erreurs) réécrit le fichier
+        columns = list(pd.read_csv(self.checkpoint, nrows=0).columns)
+        if set(frame.columns) <= set(columns):
+            frame.reindex(columns=columns).to_csv(self.checkpoint, mode="a", header=False, index=False)
+            return
+        added = [c for c in frame.columns if c not in columns and c != "error"]
+        columns = [c for c in columns if c != "error"] + added + ["error"]
+        merged = pd.concat([pd.read_csv(self.checkpoint), frame], ignore_index=True)
+        merged.reindex(columns=columns).to_csv(self.checkpoint, index=False)
+
+    def _shared_store(self, strategy=None):
+        # instance témoin : fournit le fichier de données et les symboles utilisés
+        strategy = strategy or self.strategy_cls(*self.strategy_args, save_outputs=False)
+        handler = strategy.data_handler
+        return handler.data_path, SharedPriceStore.from_handler(handler, strategy_symbols(strategy), FIELDS)
+
+    def run(self):
+        previous = self._load_checkpoint()
+        if "error" in previous.columns:
+            # les combinaisons en erreur sont relancées
+            previous = previous[previous["error"].isna()]
+        done = self._done(previous)
+        todo = [c for c in self.combinations() if _key(c.values()) not in done]
+        rows = []
+        if todo:
+            data_path, store = self._shared_store()
+            try:
+                with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(store.spec(), data_path)) as pool:
+                    futures = [pool.submit(_run_one, self.strategy_cls, self.strategy_args, c) for c in todo]
+                    for future in tqdm(as_completed(futures), total=len(futures), desc="Sweep"):
+                        row = future.result()
+                        self._append_checkpoint(row)
+                        rows.append(row)
+            finally:
+                store.close(unlink=True)
+
+        results = pd.concat([previous, pd.DataFrame(rows)], ignore_index=True)
+        if "Sharpe Ratio" in results.columns:
+            results = results.sort_values("Sharpe Ratio", ascending=False, na_position="last")
+        return results.reset_index(drop=True)
@@ -0,0 +1,129 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from tabulate import tabulate
+from tqdm import tqdm
+from core.sweep import ParameterSweep, _init_worker, _run_one, strategy_symbols
+from core.portfolio import Portfolio
+from core.compute_performance import PerformanceAnalyzer
+from utils.config_loader import load_yaml
+
+# colonnes ajoutées par PerformanceAnalyzer, absentes de l'historique du portefeuille
+_ANALYZER_COLUMNS = ["returns", "cumulative_return", "cum_max", "drawdown"]
+
+
+def _run_fold(strategy_cls, strategy_args, combos, fold, objective):
+    # Un fold = une optimisation dans l'échantillon puis un run hors échantillon.
+    # Les combinaisons passent dans le même process : spreads / covariances en cache
+    # sont réutilisés d'une combinaison à l'autre et avec les folds déjà traités.
+    number, is_start, is_end, oos_start, oos_end = fold
+    row = {
+        "fold": number,
+        "in_sample_start": is_start.date(), "in_sample_end": is_end.date(),
+        "out_of_sample_start": oos_start.date(), "out_of_sample_end": oos_end.date(),
+    }
+    in_sample = [_run_one(strategy_cls, strategy_args, params, period=(is_start, is_end)) for params in combos]
+    scores = [r.get(objective, np.nan) if r["error"] is None else np.nan for r in in_sample]
+    if np.isnan(scores).all():
+        errors = {r["error"] for r in in_sample if r["error"] is not None}
+        return {**row, "error": "; ".join(sorted(errors)) or f"aucun {objective} calculable"}, None
+
+    best = combos[int(np.nanargmax(scores))]
+    try:
+        strategy = strategy_cls(*strategy_args, params=best, save_outputs=False, period=(oos_start, oos_end))
+        stats = strategy.backtest_statistics()
+    except Exception as e:
+        return {**row, **best, "error": repr(e)}, None
+    history = strategy.analyzer.get_dataframe().drop(columns=_ANALYZER_COLUMNS)
+    return {
+        **row, **best,
+        f"IS {objective}": np.nanmax(scores),
+        **{f"OOS {k}": v for k, v in stats.items()},
+        "error": None,
+    }, history
+
+
+class WalkForward(ParameterSweep):
+    """
+    Walk-forward sur la période de general.yaml : folds glissants de `in_sample_months`
+    d'optimisation (grille ou tirage de ParameterSweep, meilleur `objective`) suivis de
+    `out_of_sample_months` de run avec les paramètres retenus.
+
+        wf = WalkForward(PairsTradingStrategy, (("AVB", "CPT"),),
+                         grid={"window": [126, 252], "z_enter": [1.5, 2, 2.5]})
+        folds, stats = wf.run()
+
+    Les folds tournent en parallèle sur le jeu de prix partagé. Les courbes hors
+    échantillon sont enchaînées par Portfolio.stitch (wf.portfolio_df).
+    """
+
+    def __init__(self, strategy_cls, strategy_args=(), grid=None, n_random=None, seed=0,
+                 workers=None, in_sample_months=None, out_of_sample_months=None, objective=None,
+                 save_outputs=True):
+        self.config = load_yaml("config/walk_forward.yaml")
+        super().__init__(strategy_cls, strategy_args, grid=grid, n_random=n_random, seed=seed,
+                         workers=workers or self.config.get("workers"))
+        self.in_sample_months = in_sample_months or self.config["in_sample_months"]
+        self.out_of_sample_months = out_of_sample_months or self.config["out_of_sample_months"]
+        self.objective = objective or self.config.get("objective", "Sharpe Ratio")
+        self.save_outputs = save_outputs
+        general_config = load_yaml("config/general.yaml")
+        self.start = pd.Timestamp(general_config["start_date"])
+        self.end = pd.Timestamp(general_config["end_date"])
+        self.portfolio_df = None
+
+    def folds(self):
+        """
+        (numéro, début IS, fin IS, début OOS, fin OOS), bornes incluses.
+        La fenêtre avance de la durée hors échantillon : les périodes OOS se suivent
+        sans se chevaucher, la dernière est tronquée à la fin de la période.
+        """
+        folds = []
+        is_start = self.start
+        while True:
+            oos_start = is_start + pd.DateOffset(months=self.in_sample_months)
+            if oos_start >= self.end:
+                break
+            next_start = oos_start + pd.DateOffset(months=self.out_of_sample_months)
+            oos_end = self.end if next_start >= self.end else next_start - pd.Timedelta(days=1)
+            folds.append((len(folds), is_start, oos_start - pd.Timedelta(days=1), oos_start, oos_end))
+            is_start += pd.DateOffset(months=self.out_of_sample_months)
+        return folds
+
+    def run(self):
+        folds = self.folds()
+        combos = self.combinations()
+        if not folds or not combos:
+            raise ValueError("Walk-forward vide : période trop courte ou grille vide")
+
+        strategy = self.strategy_cls(*self.strategy_args, save_outputs=self.save_outputs)
+        data_path, store = self._shared_store(strategy)
+        try:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(folds)), initializer=_init_worker,
+                                     initargs=(store.spec(), data_path)) as pool:
+                futures = [
+                    pool.submit(_run_fold, self.strategy_cls, self.strategy_args, combos, fold, self.objective)
+                    for fold in folds
+                ]
+                results = [future.result() for future in tqdm(futures, desc="Walk-forward")]
+        finally:
+            store.close(unlink=True)
+
+        table = pd.DataFrame([row for row, _ in results]).set_index("fold")
+        histories = [history for _, history in results if history is not None]
+        if not histories:
+            raise RuntimeError(f"Aucun fold hors échantillon n'a abouti :\n{table['error']}")
+
+        if self.save_outputs:
+            os.makedirs(f"output/{strategy.name}", exist_ok=True)
+        portfolio = Portfolio(symbols=strategy_symbols(strategy), data_handler=strategy.data_handler, strategy=strategy)
+        self.portfolio_df = portfolio.stitch(histories)
+        analyzer = PerformanceAnalyzer(strategy.data_handler, self.portfolio_df, {}, strategy=strategy)
+        stats = analyzer.compute_statistics()
+        if self.save_outputs:
+            table.to_csv(f"output/{strategy.name}/walk_forward.csv")
+            print(tabulate(table, headers="keys", tablefmt="fancy_grid"))
+            print(tabulate(pd.DataFrame.from_dict(stats, orient="index", columns=["Walk-forward OOS"]),
+                           headers="keys", tablefmt="fancy_grid"))
+        return table, stats
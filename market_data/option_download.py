@@ -1,8 +1,18 @@
+import os
+import json
+import time
+import random
 import requests
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
 import yfinance as yf
-import os
+from utils.option_store import OptionStore
+from utils.config_loader import load_yaml
+
+CBOE_URL = "https://cdn.cboe.com/api/global/delayed_quotes/options/{ticker}.json"
 
 ###########################################
 # Parsing OCC symbols (expiration, type, strike)
@@ -28,45 +38,93 @@ def parse_occ_option_symbol(symbol: str, underlying: str):
     return expiration, opt_type, strike
 
 
-###########################################
-# Download NVDA option surface from CBOE
-###########################################
+def parse_occ_symbols(symbols):
+    """
+    Version vectorisée : les 15 derniers caractères d'un symbole OCC sont à largeur
+    fixe (AAMMJJ, C/P, strike x 1000 sur 8 chiffres), quelle que soit la racine.
+    Retourne (expiration datetime64[D], type, strike) en tableaux NumPy.
+    """
+    codes = pd.Series(symbols, dtype=object).str[-15:].to_numpy(dtype="S15")
+    chars = codes.view(np.uint8).reshape(-1, 15)
+    digits = chars.astype(np.int64) - ord("0")
+    weights = lambda n: 10 ** np.arange(n - 1, -1, -1)
+    year = digits[:, 0:2] @ weights(2) + 2000
+    month = digits[:, 2:4] @ weights(2)
+    day = digits[:, 4:6] @ weights(2)
+    expiration = ((year - 1970).astype("datetime64[Y]").astype("datetime64[M]") + (month - 1)).astype("datetime64[D]") + (day - 1)
+    opt_type = chars[:, 6].view("S1").astype(str)
+    strike = (digits[:, 7:] @ weights(8)) / 1000.0
+    return expiration, opt_type, strike
 
-def get_cboe_surface(ticker: str) -> pd.DataFrame:
-    url = f"https://cdn.cboe.com/api/global/delayed_quotes/options/{ticker.upper()}.json"
-    r = requests.get(url)
-    r.raise_for_status()
-    data = r.json()
 
-    options = data["data"]["options"]
-    rows = []
+# champ CBOE -> colonne de l'historique
+CBOE_FIELDS = {
+    "bid": "bid", "ask": "ask", "iv": "iv", "delta": "delta", "gamma": "gamma", "theta": "theta",
+    "vega": "vega", "rho": "rho", "volume": "volume", "open_interest": "open_interest",
+    "last_trade_price": "last", "last_trade_time": "last_trade_time",
+}
 
-    for opt in options:
-        occ = opt["option"]
 
-        expiration, opt_type, strike = parse_occ_option_symbol(occ, ticker.upper())
+def normalize_cboe_chain(data, date=None) -> pd.DataFrame:
+    # construit le DataFrame colonne par colonne (une liste par champ) plutôt qu'un dict par contrat
+    options = data["data"]["options"]
+    symbols = [opt["option"] for opt in options]
+    expiration, opt_type, strike = parse_occ_symbols(symbols)
+    columns = {
+        "date": pd.Timestamp(date or datetime.now().date()),          # TODAY'S DATE
+        "option_symbol": symbols,
+        "expiration": expiration,
+        "type": opt_type,
+        "strike": strike,
+    }
+    for field, column in CBOE_FIELDS.items():
+        values = [opt.get(field) for opt in options]
+        columns[column] = values if column == "last_trade_time" else np.array(values, dtype=np.float64)
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(symbols)))
 
-        rows.append({
-            "date": datetime.now().date(),          # TODAY'S DATE
-            "option_symbol": occ,
-            "expiration": expiration,
-            "type": opt_type,
-            "strike": strike,
-            "bid": opt.get("bid", None),
-            "ask": opt.get("ask", None),
-            "iv": opt.get("iv", None),
-            "delta": opt.get("delta", None),
-            "gamma": opt.get("gamma", None),
-            "theta": opt.get("theta", None),
-            "vega": opt.get("vega", None),
-            "rho": opt.get("rho", None),
-            "volume": opt.get("volume", None),
-            "open_interest": opt.get("open_interest", None),
-            "last": opt.get("last_trade_price", None),
-            "last_trade_time": opt.get("last_trade_time", None),
-        })
 
-    return pd.DataFrame(rows)
+###########################################
+# Download NVDA option surface from CBOE
+###########################################
+
+def get_cboe_surface(ticker: str, transport=None) -> pd.DataFrame:
+    transport = transport or HttpTransport()
+    return normalize_cboe_chain(transport.cboe_chain(ticker.upper()))
+
+
+def _benchmark(n_contracts=12000, repeat=5):
+    """ Ingestion d'une chaîne de la taille de SPY : boucle parse_occ_option_symbol vs normalize_cboe_chain. """
+    rng = np.random.default_rng(0)
+    expiries = pd.date_range("2026-01-16", periods=40, freq="W-FRI").strftime("%y%m%d")
+    options = [{
+        "option": f"SPY{rng.choice(expiries)}{rng.choice(['C', 'P'])}{int(rng.uniform(300, 900) * 1000):08d}",
+        **{field: float(rng.random()) for field in CBOE_FIELDS if field != "last_trade_time"},
+        "last_trade_time": "2025-12-12T15:59:59",
+    } for _ in range(n_contracts)]
+    data = {"data": {"options": options}}
+
+    def loop():
+        rows = []
+        for opt in options:
+            expiration, opt_type, strike = parse_occ_option_symbol(opt["option"], "SPY")
+            rows.append({"option_symbol": opt["option"], "expiration": expiration, "type": opt_type, "strike": strike,
+                         **{column: opt.get(field, None) for field, column in CBOE_FIELDS.items()}})
+        return pd.DataFrame(rows)
+
+    timings = {}
+    for name, fn in (("boucle", loop), ("vectorisé", lambda: normalize_cboe_chain(data))):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            df = fn()
+        timings[name] = (time.perf_counter() - start) / repeat
+        if name == "boucle":
+            reference = df
+    same = (np.array_equal(pd.to_datetime(reference["expiration"]).to_numpy(), df["expiration"].to_numpy())
+            and np.array_equal(reference["strike"].to_numpy(), df["strike"].to_numpy())
+            and np.array_equal(reference["type"].to_numpy(), df["type"].to_numpy()))
+    print(f"{n_contracts} contrats | boucle : {timings['boucle']*1e3:.1f} ms | vectorisé : {timings['vectorisé']*1e3:.1f} ms "
+          f"(x{timings['boucle']/timings['vectorisé']:.1f}) | identiques : {same}")
+    return timings
 
 
 ###########################################
@@ -79,6 +137,100 @@ def get_spot_yahoo(ticker):
     return float(price)
 
 
+def get_spots_yahoo(tickers):
+    # un seul appel yfinance pour toute la liste (les tickers sont téléchargés en parallèle par yfinance)
+    data = yf.download(list(tickers), period="5d", progress=False, auto_adjust=False)
+    close = data["Close"] if "Close" in data else pd.DataFrame()
+    if isinstance(close, pd.Series):
+        close = close.to_frame(tickers[0])
+    close = close.dropna(how="all")
+    if close.empty:
+        # yfinance indisponible : pas de spot, download_ticker marque chaque ticker en erreur
+        return {}
+    last = close.ffill().iloc[-1]
+    return {ticker: float(last[ticker]) for ticker in tickers if pd.notna(last.get(ticker))}
+
+
+###########################################
+# Transports : HTTP (session partagée) ou fixtures JSON rejouées hors ligne
+###########################################
+
+class HttpTransport:
+    def __init__(self, pool_size=8, timeout=20, record_dir=None):
+        # pool de connexions keep-alive partagé par les threads de téléchargement
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.timeout = timeout
+        self.record_dir = record_dir
+
+    def cboe_chain(self, ticker):
+        r = self.session.get(CBOE_URL.format(ticker=ticker), timeout=self.timeout)
+        r.raise_for_status()
+        data = r.json()
+        if self.record_dir:
+            _write_fixture(self.record_dir, f"{ticker}.json", data)
+        return data
+
+    def spots(self, tickers):
+        spots = get_spots_yahoo(tickers)
+        if self.record_dir:
+            _write_fixture(self.record_dir, "spots.json", spots)
+        return spots
+
+
+class ReplayTransport:
+    """
+    Rejoue des réponses enregistrées (HttpTransport(record_dir=...)) :
+    {directory}/{TICKER}.json pour CBOE, {directory}/spots.json pour les spots.
+    `latency` simule le temps réseau d'une requête.
+    """
+
+    def __init__(self, directory, latency=0.0):
+        self.directory = directory
+        self.latency = latency
+
+    def _read(self, name):
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"fixture absente : {path}")
+        time.sleep(self.latency)
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def cboe_chain(self, ticker):
+        return self._read(f"{ticker}.json")
+
+    def spots(self, tickers):
+        spots = self._read("spots.json")
+        return {ticker: spots[ticker] for ticker in tickers if ticker in spots}
+
+
+def _write_fixture(directory, name, data):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+def _retryable(error):
+    # erreurs réseau, 429 et 5xx : on réessaie ; 404 (ticker inconnu) et autres 4xx : non
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, requests.RequestException)
+
+
+def with_retry(fn, retries=3, backoff=0.5):
+    """ Appelle fn() avec backoff exponentiel (+ jitter), retourne (résultat, nombre de tentatives). """
+    for attempt in range(retries + 1):
+        try:
+            return fn(), attempt + 1
+        except Exception as e:
+            if attempt == retries or not _retryable(e):
+                raise
+            time.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+
 ###########################################
 # Clean and filter option surface
 ###########################################
@@ -98,43 +250,85 @@ def clean_surface(df: pd.DataFrame, spot: float):
 
 
 ###########################################
-# Append daily data to master CSV
+# Append daily data to the option store
 ###########################################
 
-def update_history(df: pd.DataFrame, filename):
-    if os.path.exists(filename):
-        old = pd.read_csv(filename, parse_dates=["date", "expiration"])
-        full = pd.concat([old, df], ignore_index=True)
-        full = full.drop_duplicates(subset=["date", "option_symbol"])
-    else:
-        full = df
-
-    full.to_csv(filename, index=False)
-    print(f"Updated {filename} with {len(df)} new rows.")
-    return full
+def update_history(df: pd.DataFrame, ticker, store=None):
+    # seules les lignes absentes de la partition du jour sont écrites
+    store = store or OptionStore()
+    written = store.append(ticker, df)
+    print(f"Updated {ticker} with {written} new rows ({len(df) - written} already stored).")
+    return written
 
 
 ###########################################
-# Main
+# Ingestion concurrente
 ###########################################
 
-if __name__ == "__main__":
-    tickers = ["SPY", "QQQ", "AAPL", "MSFT", "NVDA", "TSLA"]
-    for TICKER in tickers:
-        print("Downloading spot price...")
-        spot = get_spot_yahoo(TICKER)
-        print("Spot =", spot)
-
-        print("Downloading option surface from CBOE...")
-        df = get_cboe_surface(TICKER)
-
-        print("Cleaning data...")
+def download_ticker(ticker, spot, transport, store, retries=3, backoff=0.5):
+    """ Télécharge, nettoie et stocke la chaîne d'un ticker ; retourne ses métriques. """
+    metrics = {"ticker": ticker, "spot": spot, "attempts": 0, "contracts": 0, "rows": 0, "new_rows": 0, "error": None}
+    t0 = time.perf_counter()
+    try:
+        if spot is None:
+            raise ValueError("spot indisponible")
+        data, metrics["attempts"] = with_retry(lambda: transport.cboe_chain(ticker), retries, backoff)
+        t1 = time.perf_counter()
+        df = normalize_cboe_chain(data)
+        t2 = time.perf_counter()
         df_clean = clean_surface(df, spot)
-
         # ADD SPOT COLUMN (important!)
         df_clean["spot"] = spot
+        t3 = time.perf_counter()
+        metrics.update(contracts=len(df), rows=len(df_clean))
+        metrics["new_rows"] = store.append(ticker, df_clean) if len(df_clean) else 0
+        t4 = time.perf_counter()
+        metrics.update(download_s=t1 - t0, parse_s=t2 - t1, clean_s=t3 - t2, store_s=t4 - t3)
+    except Exception as e:
+        metrics["error"] = repr(e)
+    metrics["total_s"] = time.perf_counter() - t0
+    return metrics
+
+
+def download_all(tickers=None, transport=None, store=None, max_workers=None, retries=None, backoff=None):
+    """
+    Ingestion de toute la watch list : spots en un appel groupé, puis chaînes CBOE
+    téléchargées par un pool de `max_workers` threads (session HTTP partagée).
+    Un ticker en échec n'arrête pas les autres : voir la colonne error des métriques.
+    """
+    config = load_yaml("config/option_download.yaml")
+    tickers = [t.upper() for t in (tickers or config["tickers"])]
+    max_workers = max_workers or config.get("max_workers", 8)
+    retries = config.get("retries", 3) if retries is None else retries
+    backoff = config.get("backoff", 0.5) if backoff is None else backoff
+    if transport is None:
+        fixtures = config.get("fixtures")
+        transport = ReplayTransport(fixtures) if fixtures else \
+            HttpTransport(pool_size=max_workers, timeout=config.get("timeout", 20))
+    store = store or OptionStore()
+
+    t0 = time.perf_counter()
+    spots, _ = with_retry(lambda: transport.spots(tickers), retries, backoff)
+    spot_s = time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(download_ticker, ticker, spots.get(ticker), transport, store, retries, backoff)
+            for ticker in tickers
+        ]
+        rows = [future.result() for future in as_completed(futures)]
+
+    metrics = pd.DataFrame(rows).set_index("ticker").loc[tickers]
+    metrics.attrs.update(spot_s=spot_s, wall_s=time.perf_counter() - t0)
+    return metrics
 
-        print("Saving daily data...")
-        df_all = update_history(df_clean, filename=f"market_data/{TICKER}.csv")
 
-        print("Done! Total rows in history:", len(df_all))
+###########################################
+# Main  (depuis la racine : python -m market_data.option_download)
+###########################################
+
+if __name__ == "__main__":
+    metrics = download_all()
+    print(metrics.round(3).to_string())
+    print(f"Spots: {metrics.attrs['spot_s']:.2f}s | total: {metrics.attrs['wall_s']:.2f}s "
+          f"| somme par ticker: {metrics['total_s'].sum():.2f}s")
@@ -9,13 +9,20 @@ import json
 from utils.config_loader import load_yaml
 
 class BaseStrategy(ABC):
-    def __init__(self):
+    def __init__(self, period=None):
         self.general_config = load_yaml('config/general.yaml')
         self.capital = self.general_config["capital"]
         self.start = pd.Timestamp(self.general_config["start_date"])
         self.end = pd.Timestamp(self.general_config["end_date"])
+        # period : (début, fin) à la place de celle de general.yaml (folds du walk-forward)
+        if period is not None:
+            self.start, self.end = pd.Timestamp(period[0]), pd.Timestamp(period[1])
 
 
+    def load_config(self, path, params=None):
+        # params : surcharge des clés du YAML (utilisé par les sweeps)
+        return {**load_yaml(path), **(params or {})}
+
     def load_json_config(self, filename):
         path = os.path.join("config", filename)
         if os.path.exists(path):
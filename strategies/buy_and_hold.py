@@ -1,24 +1,28 @@
 import config
 from strategies.base import BaseStrategy
-from utils.data_handler import DataHandler
+from utils.data_handler import get_data_handler
 import datetime
 import pandas as pd
 import numpy as np
 from core.execution import OrderExecutor
-from core.compute_performance import PerformanceAnalyzer
+from core.compute_performance import PerformanceAnalyzer, batch_xirr
 from core.portfolio import Portfolio
 from tabulate import tabulate
-from utils.config_loader import load_yaml
+
+# (preset, start, end, fee, slippage, ...) -> (portfolio_df, stats_df)
+_benchmark_cache = {}
+
 
 class BuyAndHold(BaseStrategy):
-    def __init__(self, preset):
-        super().__init__()
+    def __init__(self, preset, params=None, save_outputs=True, period=None):
+        super().__init__(period)
         self.name = "Buy and Hold Strategy"
-        self.config = load_yaml('config/buy_and_hold.yaml')
+        self.config = self.load_config('config/buy_and_hold.yaml', params)
+        self.save_outputs = save_outputs
         self.preset = preset
         self.reallocation_window = self.config["reallocation_window"]
         self.reallocation_amount = self.config["reallocation_amount"]
-        self.data_handler = DataHandler(data_path = "data/etf.pkl")
+        self.data_handler = get_data_handler("data/etf.pkl")
         self.assets_dict = self.config["portfolio_presets"].get(self.preset,{self.preset: 1})
         self.dates = self.data_handler.get(self.assets_dict.keys(), start=self.start, end=self.end).index
     
@@ -50,18 +54,10 @@ class BuyAndHold(BaseStrategy):
         self.orders = self.generate_orders()
         active_symbols = list(self.assets_dict.keys())
         portfolio = Portfolio(symbols=active_symbols, data_handler=self.data_handler, strategy=self)
-        date_range = pd.date_range(start=self.start, end=self.end)
-        total_fees = 0
-        self.executed_orders = {}
-        for date in date_range:
-            if date not in self.dates:
-                continue
-            orders_today = self.orders.get(date, [])  
-            executed = executor.execute(orders_today, date, order_time='Adj Close')
-            total_fees += sum(order.get("fee", 0.0) for order in executed[date])
-            self.executed_orders[date] = executed[date]
-            portfolio.update(date, executed)
-        portfolio_df = portfolio.get_history()
+        dates = self.dates[(self.dates >= self.start) & (self.dates <= self.end)]
+        self.executed_orders, self.trades_df = executor.execute_batch(self.orders, dates, order_time='Adj Close')
+        total_fees = sum(sum(order.get("fee", 0.0) for order in day) for day in self.executed_orders.values())
+        portfolio_df = portfolio.run(dates, self.executed_orders)
         self.analyzer = PerformanceAnalyzer(self.data_handler, portfolio_df, self.orders, strategy=self)
         if self.reallocation_amount == 0:
             stats = self.analyzer.compute_statistics(total_fees)
@@ -70,8 +66,78 @@ class BuyAndHold(BaseStrategy):
         stats_df = pd.DataFrame.from_dict(stats, orient='index', columns=["Portefeuille"] if not preset=='SPY' else ['Benchmark'])
         return portfolio_df, stats_df
         
+    def cached_benchmark(self, preset='SPY'):
+        weights = self.config["portfolio_presets"].get(preset, {preset: 1})
+        key = (
+            preset, tuple(sorted(weights.items())), self.start, self.end, self.general_config["capital"],
+            self.general_config["fee_rate"], self.general_config["slippage"],
+            self.reallocation_window, self.reallocation_amount,
+            self.data_handler.data_path, self.data_handler.mtime,
+        )
+        if key not in _benchmark_cache:
+            # instance dédiée (run_benchmark écrase assets_dict / orders / analyzer), avec les
+            # paramètres de self : le benchmark suit les mêmes réallocations
+            benchmark = BuyAndHold(preset=preset, params=self.config, save_outputs=False, period=(self.start, self.end))
+            _benchmark_cache[key] = benchmark.run_benchmark(preset=preset)
+        portfolio_df, stats_df = _benchmark_cache[key]
+        return portfolio_df.copy(), stats_df.copy()
+
+    def backtest_statistics(self):
+        _, stats_df = self.run_benchmark(preset=self.preset)
+        return stats_df.iloc[:, 0].to_dict()
+
+    def dca_scenarios(self, amounts, windows):
+        """
+        Compare des plans d'investissement programmé (reallocation_amount x reallocation_window)
+        avec les mêmes statistiques que compute_statistics_with_flows.
+        Les dépôts sont sans frais : la valeur finale vaut celle du portefeuille sans dépôt
+        plus montant x (croissance cumulée d'un dépôt unitaire). Un seul backtest suffit,
+        les TRI de tous les scénarios sont résolus ensemble (batch_xirr).
+        """
+        base = BuyAndHold(self.preset, params={**self.config, "reallocation_amount": 0.0},
+                          save_outputs=False, period=(self.start, self.end))
+        portfolio_df, _ = base.run_benchmark(preset=self.preset)
+        first_date, end_date = base.dates[0], portfolio_df.index[-1]
+        base_value = portfolio_df["value"].iloc[-1]
+
+        # croissance jusqu'à la fin d'un dépôt de 1 réparti selon les poids du preset
+        assets = [asset for asset, weight in self.assets_dict.items() if weight != 0]
+        weights = np.array([self.assets_dict[asset] for asset in assets])
+        prices = self.data_handler.get_multiple_df(assets, price='Adj Close').loc[base.dates].to_numpy()
+        growth = (prices[-1] / prices) @ weights if len(prices) else np.empty(0)
+        years = (base.dates - first_date).days.to_numpy() / 365
+
+        scenarios = [(amount, window) for window in windows for amount in amounts]
+        position = np.arange(len(base.dates))
+        # mêmes dates de dépôt que generate_orders
+        deposits = {window: np.flatnonzero((position % window == 0) & (position != 0)) for window in windows}
+        width = 2 + max(len(d) for d in deposits.values())
+        times = np.zeros((len(scenarios), width))
+        flows = np.zeros((len(scenarios), width))
+        final = np.empty(len(scenarios))
+        for i, (amount, window) in enumerate(scenarios):
+            rows = deposits[window] if amount != 0 else np.empty(0, dtype=int)
+            final[i] = base_value + amount * growth[rows].sum()
+            times[i, 1:len(rows) + 1] = years[rows]
+            flows[i, 0] = -self.capital
+            flows[i, 1:len(rows) + 1] = -amount
+            times[i, -1] = (end_date - first_date).days / 365
+            flows[i, -1] = final[i]
+
+        irr = batch_xirr(times, flows)
+        invested = -np.where(flows < 0, flows, 0).sum(axis=1)
+        return pd.DataFrame({
+            "reallocation_amount": [amount for amount, _ in scenarios],
+            "reallocation_window": [window for _, window in scenarios],
+            "Money-Weighted Return (IRR %)": np.round(irr * 100, 2),
+            "Total Capital Invested (€)": np.round(invested, 2),
+            "Portfolio Final Value (€)": np.round(final, 2),
+            "Interests (€)": np.round(final - invested, 2),
+            "Total Return (%)": np.round(final / invested * 100 - 100, 2),
+        })
+
     def run_backtest(self, plot=False):
-        benchmark_portfolio_df, benchmark_stats_df = self.run_benchmark('SPY')
+        benchmark_portfolio_df, benchmark_stats_df = self.cached_benchmark('SPY')
         portfolio_df, stats_df = self.run_benchmark(preset=self.preset)
         all_stats = pd.concat([stats_df, benchmark_stats_df], axis=1)
         all_stats.index.name = "Statistique"
@@ -88,7 +154,7 @@ class BuyAndHold(BaseStrategy):
                 equity_df=portfolio_df,
                 weights_df=pd.DataFrame.from_dict(self.assets_dict, orient='index', columns=["Weights"]),
                 ohlc_data=ohlc_dict,
-                trades_df=None,
+                trades_df=self.trades_df,
                 frontier_df=getattr(self, "frontier_df", None)
             )
 
@@ -0,0 +1,257 @@
+import os
+import json
+import math
+import time
+from collections import deque
+import pandas as pd
+from datetime import datetime, timedelta, date
+from strategies.iv_crush.history import HistoryClient
+
+# barres journalières par (symbole, whatToShow), en Parquet :
+# data/ib_bars/NVDA_TRADES.parquet, NVDA_OPTION_IMPLIED_VOLATILITY.parquet, VIX_TRADES.parquet
+# + NVDA_TRADES.ranges.json : intervalles de dates déjà demandés à TWS
+BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+
+# nombre de séances par unité de durée IB ("7 D", "2 W", "1 Y"...)
+_SESSIONS = {"D": 1, "W": 5, "M": 21, "Y": 252}
+# jours calendaires couvrant ces séances (week-ends et fériés compris)
+_CALENDAR_DAYS = {"D": 7 / 5, "W": 7, "M": 31, "Y": 366}
+
+
+def ib_duration(days):
+    """ Durée IB couvrant `days` jours : au-delà de 365 jours IB exige des années. """
+    return f"{days} D" if days <= 365 else f"{math.ceil(days / 365)} Y"
+
+
+def _as_datetime(end):
+    if type(end) == str:
+        return datetime.strptime(end, "%Y-%m-%d")
+    return end if isinstance(end, datetime) else datetime.combine(end, datetime.min.time())
+
+
+def requested_range(end, duration):
+    """ (début, fin) calendaires d'une requête (end, "N D|W|M|Y"), avec marge pour les fériés. """
+    count, unit = duration.split()
+    end = _as_datetime(end).date()
+    return end - timedelta(days=math.ceil(int(count) * _CALENDAR_DAYS[unit]) + 5), end
+
+
+def merge_ranges(ranges, gap_days=0):
+    """ Union d'intervalles de dates [début, fin] ; fusionne aussi ceux séparés de moins de gap_days. """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=gap_days + 1):
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(r) for r in merged]
+
+
+def missing_ranges(start, end, covered):
+    """ Parties de [start, end] absentes des intervalles `covered` (triés, disjoints). """
+    gaps, cursor = [], start
+    for lo, hi in covered:
+        if hi < cursor:
+            continue
+        if lo > end:
+            break
+        if lo > cursor:
+            gaps.append((cursor, lo - timedelta(days=1)))
+        cursor = max(cursor, hi + timedelta(days=1))
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class BarCache:
+    """ Barres IB enregistrées, une table Parquet par (symbole, type de données). """
+
+    def __init__(self, root="data/ib_bars"):
+        self.root = root
+        self._frames = {}
+
+    def path(self, symbol, what):
+        return os.path.join(self.root, f"{symbol}_{what}.parquet")
+
+    def load(self, symbol, what):
+        key = (symbol, what)
+        if key not in self._frames:
+            path = self.path(symbol, what)
+            legacy = os.path.join(self.root, f"{symbol}_{what}.csv")
+            if os.path.exists(path):
+                df = pd.read_parquet(path)
+            elif os.path.exists(legacy):
+                # caches CSV enregistrés avant le passage en Parquet
+                df = pd.read_csv(legacy, index_col="date")
+            else:
+                raise KeyError(f"pas de barres {what} pour {symbol} dans {self.root}")
+            # index de datetime.date, comme util.df(bars) pour des barres journalières
+            df.index = pd.Index(pd.to_datetime(df.index).date, name="date")
+            self._frames[key] = df.sort_index()
+        return self._frames[key]
+
+    def save(self, symbol, what, df):
+        """ Fusionne de nouvelles barres avec celles déjà enregistrées. """
+        os.makedirs(self.root, exist_ok=True)
+        df = df[[c for c in BAR_COLUMNS if c in df.columns]].copy()
+        df.index = pd.Index([d.date() if isinstance(d, datetime) else d for d in df.index], name="date")
+        try:
+            df = pd.concat([self.load(symbol, what), df])
+        except KeyError:
+            pass
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+        stored = df.copy()
+        stored.index = pd.DatetimeIndex(stored.index, name="date")
+        stored.to_parquet(self.path(symbol, what))
+        self._frames[(symbol, what)] = df
+
+    def coverage(self, symbol, what):
+        path = os.path.join(self.root, f"{symbol}_{what}.ranges.json")
+        if not os.path.exists(path):
+            return []
+        with open(path, "r", encoding="utf-8") as f:
+            return [(date.fromisoformat(lo), date.fromisoformat(hi)) for lo, hi in json.load(f)]
+
+    def add_coverage(self, symbol, what, start, end):
+        ranges = merge_ranges(self.coverage(symbol, what) + [(start, end)])
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, f"{symbol}_{what}.ranges.json"), "w", encoding="utf-8") as f:
+            json.dump([[lo.isoformat(), hi.isoformat()] for lo, hi in ranges], f)
+
+
+def _last_sessions(df, end, duration):
+    # durée comptée en séances (barres) se terminant à `end` inclus
+    count, unit = duration.split()
+    n = int(count) * _SESSIONS[unit]
+    return df.loc[:_as_datetime(end).date()].iloc[-n:].copy()
+
+
+class FakeIBKR(HistoryClient):
+    """
+    Remplace IBKR hors ligne : mêmes méthodes, barres servies depuis un BarCache.
+    La durée est comptée en séances (barres) se terminant à `end` inclus.
+    """
+
+    def __init__(self, cache=None):
+        self.cache = cache or BarCache()
+        self.is_connected = False
+
+    def connect(self, host="127.0.0.1", port=7497, client_id=1):
+        self.is_connected = True
+        return True
+
+    def get_history(self, symbol, what, end, duration, barSizeSetting="1 day"):
+        return _last_sessions(self.cache.load(symbol, what), end, duration)
+
+
+class PacingThrottle:
+    """
+    Limites de pacing IB sur les données historiques : au plus `max_requests` requêtes
+    par fenêtre de `window` secondes, et `same_contract` requêtes pour un même
+    (contrat, type de données) en `same_window` secondes. wait() dort le temps nécessaire.
+    """
+
+    def __init__(self, max_requests=60, window=600.0, same_contract=5, same_window=2.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.max_requests, self.window = max_requests, window
+        self.same_contract, self.same_window = same_contract, same_window
+        self.clock, self.sleep = clock, sleep
+        self.history = deque()
+        self.by_key = {}
+        self.waited = 0.0
+
+    def wait(self, key):
+        now = self.clock()
+        while self.history and now - self.history[0] >= self.window:
+            self.history.popleft()
+        recent = self.by_key.setdefault(key, deque())
+        while recent and now - recent[0] >= self.same_window:
+            recent.popleft()
+        delay = 0.0
+        if len(self.history) >= self.max_requests:
+            delay = max(delay, self.history[0] + self.window - now)
+        if len(recent) >= self.same_contract:
+            delay = max(delay, recent[0] + self.same_window - now)
+        if delay > 0:
+            self.sleep(delay)
+            self.waited += delay
+            now = self.clock()
+        self.history.append(now)
+        recent.append(now)
+
+
+class CachedIBKR(HistoryClient):
+    """
+    Client IBKR avec cache disque : mêmes méthodes que IBKR, barres journalières servies
+    depuis le BarCache. Seules les plages de dates jamais demandées partent vers TWS
+    (requêtes qui se recouvrent regroupées, plages manquantes complétées au fil de l'eau),
+    sous PacingThrottle. Les barres du jour, incomplètes, ne sont pas marquées couvertes.
+
+        ib = CachedIBKR(IBKR())
+        ib.connect()
+        OptionsStrategy(ib).backtest()
+    """
+
+    def __init__(self, ib, cache=None, throttle=None, merge_gap_days=30):
+        self.ib = ib
+        self.cache = cache or BarCache()
+        self.throttle = throttle or PacingThrottle()
+        self.merge_gap_days = merge_gap_days
+        self.requests = 0
+
+    def connect(self, *args, **kwargs):
+        return self.ib.connect(*args, **kwargs)
+
+    @property
+    def is_connected(self):
+        return self.ib.is_connected
+
+    def _fetch(self, symbol, what, start, end):
+        self.throttle.wait((symbol, what))
+        # fin de journée : la séance `end` est incluse
+        bars = self.ib.get_history(symbol, what, datetime.combine(end, datetime.max.time()).replace(microsecond=0),
+                                   ib_duration((end - start).days + 1))
+        self.requests += 1
+        if bars is not None and len(bars):
+            self.cache.save(symbol, what, bars)
+        # la séance du jour peut encore bouger : redemandée au prochain appel
+        end = min(end, date.today() - timedelta(days=1))
+        if start <= end:
+            self.cache.add_coverage(symbol, what, start, end)
+
+    def prefetch(self, symbol, what, ranges):
+        """
+        Charge en cache l'union des plages (début, fin) : les plages proches de moins de
+        merge_gap_days sont regroupées en une seule requête, seules les parties non
+        couvertes sont demandées.
+        """
+        for start, end in merge_ranges(ranges, self.merge_gap_days):
+            for gap in missing_ranges(start, end, self.cache.coverage(symbol, what)):
+                self._fetch(symbol, what, *gap)
+
+    def get_history(self, symbol, what, end, duration, barSizeSetting="1 day"):
+        if barSizeSetting != "1 day":
+            # seules les barres journalières sont en cache
+            self.throttle.wait((symbol, what))
+            self.requests += 1
+            return self.ib.get_history(symbol, what, end, duration, barSizeSetting)
+        self.prefetch(symbol, what, [requested_range(end, duration)])
+        return _last_sessions(self.cache.load(symbol, what), end, duration)
+
+
+def record_bars(ib, events, cache=None, margin_days=14):
+    """
+    Enregistre depuis TWS (IBKR connecté) les barres nécessaires au backtest : pour chaque
+    ticker, les fenêtres autour de ses annonces (regroupées par CachedIBKR.prefetch), plus le VIX.
+    """
+    cached = ib if isinstance(ib, CachedIBKR) else CachedIBKR(ib, cache)
+    dates = pd.to_datetime(events["earnings_date"])
+    margin = pd.Timedelta(days=margin_days)
+    windows = lambda d: [((x - margin).date(), (x + margin).date()) for x in d]
+    for ticker in sorted(events["ticker"].unique()):
+        t_dates = dates[events["ticker"] == ticker]
+        for what in ("TRADES", "OPTION_IMPLIED_VOLATILITY"):
+            cached.prefetch(ticker, what, windows(t_dates))
+        print(f"{ticker}: barres enregistrées")
+    cached.prefetch("VIX", "TRADES", windows(dates))
+    return cached.cache
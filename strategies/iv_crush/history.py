@@ -0,0 +1,27 @@
+from datetime import datetime, timedelta
+
+
+class HistoryClient:
+    """
+    Méthodes communes à IBKR, FakeIBKR et CachedIBKR, construites sur
+    get_history(symbol, what, end, duration, barSizeSetting) de chaque client.
+    Une date de fin en texte ('AAAA-MM-JJ') est décalée de 4 jours.
+    """
+
+    def get_history(self, symbol, what, end, duration, barSizeSetting="1 day"):
+        raise NotImplementedError
+
+    @staticmethod
+    def _end(end):
+        if type(end) == str:
+            end = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=4)
+        return end
+
+    def get_stock_history(self, ticker, end, barSizeSetting="1 day", duration="5 D"):
+        return self.get_history(ticker, "TRADES", self._end(end), duration, barSizeSetting)
+
+    def get_iv_history(self, ticker, end, barSizeSetting="1 day", duration="5 D"):
+        return self.get_history(ticker, "OPTION_IMPLIED_VOLATILITY", self._end(end), duration, barSizeSetting)
+
+    def get_vix_history(self, end, duration="5 D"):
+        return self.get_history("VIX", "TRADES", self._end(end), duration)
@@ -1,9 +1,8 @@
 # modules/ibkr.py
 from ib_insync import *
-from datetime import datetime
-from datetime import timedelta, datetime
+from strategies.iv_crush.history import HistoryClient
 
-class IBKR:
+class IBKR(HistoryClient):
     def __init__(self):
         self.ib = None
         self.is_connected = False
@@ -35,18 +34,17 @@ class IBKR:
             raise RuntimeError("IBKR non connecté.")
 
     # ------------------ Data ----------------------
-    def get_stock_history(self, ticker, end, barSizeSetting="1 day", duration="5 D"):
-        if type(end) == str:
-            end = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=4)
+    def get_history(self, symbol, what, end, duration, barSizeSetting="1 day"):
+        # requête brute : VIX est un indice CBOE, le reste des actions SMART
         self._ensure()
-        contract = Stock(ticker, "SMART", "USD")
+        contract = Index("VIX", "CBOE", "USD") if symbol == "VIX" else Stock(symbol, "SMART", "USD")
 
         bars = self.ib.reqHistoricalData(
             contract,
             endDateTime=end,
             durationStr=duration,
             barSizeSetting=barSizeSetting,
-            whatToShow="TRADES",
+            whatToShow=what,
             useRTH=True
         )
 
@@ -54,39 +52,3 @@ class IBKR:
         df.set_index("date", inplace=True)
         return df
 
-    def get_iv_history(self, ticker, end, barSizeSetting="1 day", duration="5 D"):
-        if type(end) == str:
-            end = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=4)
-        self._ensure()
-        contract = Stock(ticker, "SMART", "USD")
-
-        bars = self.ib.reqHistoricalData(
-            contract,
-            endDateTime=end,
-            durationStr=duration,
-            barSizeSetting=barSizeSetting,
-            whatToShow="OPTION_IMPLIED_VOLATILITY",
-            useRTH=True
-        )
-        df = util.df(bars)
-        df.set_index("date", inplace=True)
-        return df
-
-    def get_vix_history(self, end, duration="5 D"):
-        if type(end) == str:
-            end = datetime.strptime(end, "%Y-%m-%d") + timedelta(days=4)
-        self._ensure()
-        contract = Index("VIX", "CBOE", "USD")
-
-        bars = self.ib.reqHistoricalData(
-            contract,
-            endDateTime=end,
-            durationStr=duration,
-            barSizeSetting="1 day",
-            whatToShow="TRADES",
-            useRTH=True
-        )
-        df = util.df(bars)
-        df.set_index("date", inplace=True)
-        return df
-    
\ No newline at end of file
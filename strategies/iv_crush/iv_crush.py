@@ -1,13 +1,24 @@
+import os
+import numpy as np
 import pandas as pd    
+from typing import TYPE_CHECKING
+from tabulate import tabulate
 from strategies.iv_crush.option_pricing import call, put, straddle
-from strategies.iv_crush.ibkr import IBKR
+from strategies.iv_crush.bar_cache import ib_duration
 from datetime import datetime, timedelta
 from utils.iv_crush_utils import last_before, first_after
+from utils.config_loader import load_yaml
+
+if TYPE_CHECKING:
+    # ib_insync n'est requis que pour la connexion live (bar_cache.FakeIBKR hors ligne)
+    from strategies.iv_crush.ibkr import IBKR
 
 class OptionsStrategy():
-    def __init__(self, ibkr: IBKR):
+    def __init__(self, ibkr: "IBKR"):
+        self.name = "IV Crush Strategy"
         self.ib = ibkr
         self.historical_data = {}
+        self.config = load_yaml('config/iv_crush.yaml')
     
     def get_historical_data(self, ticker, end, barSizeSetting, duration):
         if type(end) == str:
@@ -17,7 +28,8 @@ class OptionsStrategy():
         self.historical_data[f"{ticker}_iv"] = self.ib.get_iv_history(ticker=ticker, end=end, barSizeSetting=barSizeSetting, duration=duration)
         return self.historical_data
     
-    def compute_iv_crush(self, ticker, earnings_date, strike, T=30):
+    def compute_iv_crush(self, ticker, earnings_date, strike, T=30, r=None):
+        r = self.config.get("risk_free_rate", 0.0) if r is None else r
         if type(earnings_date) == str:
             earnings_date = datetime.strptime(earnings_date, "%Y-%m-%d").date()
         end = earnings_date + timedelta(days=6)
@@ -36,13 +48,13 @@ class OptionsStrategy():
         if strike == "ATM":
             strike = pre_close
             
-        pre_straddle = straddle(S=pre_close, K=strike, T=T/365, sigma=pre_iv)
-        post_straddle = straddle(S=post_price, K=strike, T=T/365, sigma=post_iv)
+        pre_straddle = straddle(S=pre_close, K=strike, T=T/365, r=r, sigma=pre_iv)
+        post_straddle = straddle(S=post_price, K=strike, T=T/365, r=r, sigma=post_iv)
         
-        pre_call = call(S=pre_close, K=strike, T=T/365, sigma=pre_iv)
-        post_call = call(S=post_price, K=strike, T=T/365, sigma=post_iv)
-        pre_put = put(S=pre_close, K=strike, T=T/365, sigma=pre_iv)
-        post_put = put(S=post_price, K=strike, T=T/365, sigma=post_iv)
+        pre_call = call(S=pre_close, K=strike, T=T/365, r=r, sigma=pre_iv)
+        post_call = call(S=post_price, K=strike, T=T/365, r=r, sigma=post_iv)
+        pre_put = put(S=pre_close, K=strike, T=T/365, r=r, sigma=pre_iv)
+        post_put = put(S=post_price, K=strike, T=T/365, r=r, sigma=post_iv)
         
 
         short_straddle_pnl = pre_straddle - post_straddle
@@ -64,8 +76,145 @@ class OptionsStrategy():
         }
         
         return result
-        
-        
-        
+
+    def load_events(self, path=None):
+        events = pd.read_csv(path or self.config.get("events", "data/earnings_with_pnl.csv"))
+        events["earnings_date"] = pd.to_datetime(events["earnings_date"])
+        # événements passés uniquement : les résultats à venir n'ont pas encore de barres
+        return events[events["earnings_date"] < pd.Timestamp.today().normalize()]
+
+    def backtest(self, events=None, strike="ATM", T=None, r=None, margin_days=14, save_outputs=True):
+        """
+        Short straddle sur tous les événements (data/earnings_with_pnl.csv par défaut) :
+        une requête actions et une requête IV par ticker couvrant tous ses événements
+        (IBKR live ou bar_cache.FakeIBKR hors ligne), puis mêmes calculs que
+        compute_iv_crush, vectorisés sur l'ensemble des événements.
+        Retourne (résultats par événement, statistiques agrégées).
+        """
+        T = self.config.get("dte", 30) if T is None else T
+        r = self.config.get("risk_free_rate", 0.0) if r is None else r
+        events = self.load_events() if events is None else events.copy()
+        events["earnings_date"] = pd.to_datetime(events["earnings_date"])
+        events = events.sort_values(["ticker", "earnings_date"]).reset_index(drop=True)
+        n = len(events)
+        pre_close, post_open, post_close, pre_iv, post_iv = (np.full(n, np.nan) for _ in range(5))
+        post_date = np.full(n, np.datetime64("NaT"), dtype="datetime64[D]")
+        status = np.full(n, "ok", dtype=object)
+
+        for ticker, group in events.groupby("ticker", sort=False):
+            rows = group.index.to_numpy()
+            dates = group["earnings_date"].to_numpy().astype("datetime64[D]")
+            end = (group["earnings_date"].max() + pd.Timedelta(days=margin_days)).to_pydatetime()
+            duration = ib_duration((group["earnings_date"].max() - group["earnings_date"].min()).days + 2 * margin_days)
+            try:
+                stock = self.ib.get_stock_history(ticker=ticker, end=end, barSizeSetting="1 day", duration=duration)
+                iv = self.ib.get_iv_history(ticker=ticker, end=end, barSizeSetting="1 day", duration=duration)
+            except Exception as e:
+                status[rows] = f"pas de barres : {e}"
+                continue
+            stock_dates = np.array(stock.index, dtype="datetime64[D]")
+            iv_dates = np.array(iv.index, dtype="datetime64[D]")
+
+            # séance IV précédente / suivante (last_before / first_after de compute_iv_crush)
+            i_prev = np.searchsorted(iv_dates, dates, side="left") - 1
+            i_post = np.searchsorted(iv_dates, dates, side="right")
+            ok = (i_prev >= 0) & (i_post < len(iv_dates))
+            i_prev, i_post = np.clip(i_prev, 0, None), np.minimum(i_post, len(iv_dates) - 1)
+            # cours le jour de l'annonce et à la séance suivante
+            post = iv_dates[i_post]
+            j_pre = np.minimum(np.searchsorted(stock_dates, dates), len(stock_dates) - 1)
+            j_post = np.minimum(np.searchsorted(stock_dates, post), len(stock_dates) - 1)
+            ok &= (stock_dates[j_pre] == dates) & (stock_dates[j_post] == post)
+            status[rows[~ok]] = "séance manquante autour de l'annonce"
+
+            keep = rows[ok]
+            pre_close[keep] = stock["close"].to_numpy()[j_pre[ok]]
+            post_open[keep] = stock["open"].to_numpy()[j_post[ok]]
+            post_close[keep] = stock["close"].to_numpy()[j_post[ok]]
+            pre_iv[keep] = iv["close"].to_numpy()[i_prev[ok]]
+            post_iv[keep] = iv["close"].to_numpy()[i_post[ok]]
+            post_date[keep] = post[ok]
+
+        post_price = (post_open + post_close) / 2
+        K = pre_close if strike == "ATM" else np.full(n, float(strike))
+        pre_call = call(S=pre_close, K=K, T=T/365, r=r, sigma=pre_iv)
+        post_call = call(S=post_price, K=K, T=T/365, r=r, sigma=post_iv)
+        pre_put = put(S=pre_close, K=K, T=T/365, r=r, sigma=pre_iv)
+        post_put = put(S=post_price, K=K, T=T/365, r=r, sigma=post_iv)
+        pre_straddle = straddle(S=pre_close, K=K, T=T/365, r=r, sigma=pre_iv)
+        post_straddle = straddle(S=post_price, K=K, T=T/365, r=r, sigma=post_iv)
+        short_straddle_pnl = pre_straddle - post_straddle
+
+        results = pd.DataFrame({
+            "ticker": events["ticker"],
+            "earnings_date": events["earnings_date"],
+            "post_date": pd.to_datetime(post_date),
+            "status": status,
+            "pre_close": pre_close,
+            "post_price": post_price,
+            "pre_iv": pre_iv*100,
+            "post_iv": post_iv*100,
+            "pre_call": pre_call,
+            "post_call": post_call,
+            "pre_put": pre_put,
+            "post_put": post_put,
+            "pre_straddle": pre_straddle,
+            "post_straddle": post_straddle,
+            "short_straddle_pnl": short_straddle_pnl,
+            "pnl_pct": short_straddle_pnl / pre_straddle,
+        })
+        stats = iv_crush_statistics(results)
+        if save_outputs:
+            os.makedirs(f"output/{self.name}", exist_ok=True)
+            results.to_csv(f"output/{self.name}/backtest_events.csv", index=False)
+            stats.to_csv(f"output/{self.name}/backtest_statistics.csv")
+            print(tabulate(stats, headers="keys", tablefmt="fancy_grid"))
+        return results, stats
+
+
+def iv_crush_statistics(results):
+    """ Statistiques du short straddle par ticker et sur l'ensemble (colonne 'Total'). """
+    traded = results[results["status"] == "ok"]
+
+    def summary(df):
+        pnl = df["pnl_pct"] * 100
+        return {
+            "Events": len(df),
+            "Win Rate (%)": round((pnl > 0).mean() * 100, 2) if len(df) else np.nan,
+            "Mean P&L (%)": round(pnl.mean(), 2),
+            "Median P&L (%)": round(pnl.median(), 2),
+            "Std P&L (%)": round(pnl.std(), 2),
+            "Mean / Std": round(pnl.mean() / pnl.std(), 3) if pnl.std() > 0 else np.nan,
+            "Worst (%)": round(pnl.min(), 2),
+            "Best (%)": round(pnl.max(), 2),
+            "Total P&L ($ / straddle)": round(df["short_straddle_pnl"].sum(), 2),
+            "Mean IV Crush (pts)": round((df["post_iv"] - df["pre_iv"]).mean(), 2),
+        }
+
+    # une colonne par ticker des résultats, même si tous ses événements ont été écartés
+    tickers = sorted(results["ticker"].unique())
+    stats = {ticker: summary(traded[traded["ticker"] == ticker]) for ticker in tickers}
+    stats["Total"] = summary(traded)
+    stats = pd.DataFrame(stats)
+    skipped = results["status"] != "ok"
+    stats.loc["Skipped"] = skipped.groupby(results["ticker"]).sum().reindex(tickers).astype(int).tolist() \
+        + [int(skipped.sum())]
+    stats.index.name = "Statistique"
+    return stats
 
 
+if __name__ == "__main__":
+    # backtest hors ligne sur les barres enregistrées ; --live : TWS derrière le cache disque
+    # (seules les barres absentes du cache sont demandées)
+    import sys
+    from strategies.iv_crush.bar_cache import BarCache, FakeIBKR, CachedIBKR
+    config = load_yaml('config/iv_crush.yaml')
+    cache = BarCache(config.get("bar_cache", "data/ib_bars"))
+    if "--live" in sys.argv:
+        from strategies.iv_crush.ibkr import IBKR
+        ib = CachedIBKR(IBKR(), cache)
+        ib.connect()
+    else:
+        ib = FakeIBKR(cache)
+    strategy = OptionsStrategy(ib)
+    strategy.backtest()
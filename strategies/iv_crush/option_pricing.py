@@ -1,69 +1,225 @@
 import numpy as np
-from scipy.stats import norm
+import pandas as pd
+from scipy.special import erfc
 
+SQRT_2 = np.sqrt(2.0)
+SQRT_2PI = np.sqrt(2.0 * np.pi)
 
-def call(S, K, T, r, sigma):
-    d1 = (np.log(S / K) + (r + sigma**2/2) * T) / (sigma * np.sqrt(T))
-    d2 = d1 - sigma * np.sqrt(T)
-    return S * norm.cdf(d1) - K * np.exp(- r * T) * norm.cdf(d2)
-
-def put(S, K, T, r, sigma):
-    d1 = (np.log(S / K) + (r + sigma**2/2) * T) / (sigma * np.sqrt(T))
-    d2 = d1 - sigma * np.sqrt(T)
-    return K * np.exp(- r * T) * norm.cdf(-d2) - S * norm.cdf(-d1)
-
-def straddle(S, K, T, r, sigma):
-    return call(S, K, T, r, sigma) + put(S, K, T, r, sigma)
-
-
-def compute_iv(price_market, S, K, T, r, right,
-               tol=1e-6, max_iter=100,
-               sig_low=1e-8, sig_high=10.0):
 
-    # ---- 1. Cas triviaux ------------------------------------
-    if price_market <= 0 or T <= 0:
-        return np.nan
+def norm_cdf(x):
+    # N(x) = erfc(-x / sqrt(2)) / 2 : ufunc directe, sans le coût de scipy.stats.norm
+    return 0.5 * erfc(-np.asarray(x, dtype=np.float64) / SQRT_2)
 
-    # ---- 2. Bornes du prix ----------------------------------
-    # prix min et max en BS
-    forward = S * np.exp(r * T)
-    
-    if right == 'C':
-        price_min = max(0, S - K * np.exp(-r*T))
-    else:  # PUT
-        price_min = max(0, K * np.exp(-r*T) - S)
+def norm_pdf(x):
+    x = np.asarray(x, dtype=np.float64)
+    return np.exp(-0.5 * x * x) / SQRT_2PI
 
-    if price_market < price_min - 1e-12:
-        # aucune volatilité ne peut générer ce prix (option trop bon marché)
-        return np.nan
 
-    # ---- 3. Algo dichotomique --------------------------------
-    for _ in range(max_iter):
-        sig_mid = 0.5 * (sig_low + sig_high)
+def _d1_d2(S, K, T, r, sigma):
+    vol_sqrt_t = sigma * np.sqrt(T)
+    d1 = (np.log(S / K) + (r + sigma**2/2) * T) / vol_sqrt_t
+    return d1, d1 - vol_sqrt_t
 
-        # Prix modèle
-        if right == 'C':
-            model = call(S, K, T, r, sig_mid)
-        else:
-            model = put(S, K, T, r, sig_mid)
 
-        diff = model - price_market
-
-        if abs(diff) < tol:
-            return sig_mid
-
-        # mise à jour des bornes
-        if diff > 0:
-            sig_high = sig_mid
-        else:
-            sig_low = sig_mid
-
-        # si bornes se touchent
-        if sig_high - sig_low < tol:
-            return sig_mid
+def call(S, K, T, r, sigma):
+    d1, d2 = _d1_d2(S, K, T, r, sigma)
+    return S * norm_cdf(d1) - K * np.exp(- r * T) * norm_cdf(d2)
 
-    # ---- 4. pas de convergence -------------------------------
-    return np.nan
+def put(S, K, T, r, sigma):
+    d1, d2 = _d1_d2(S, K, T, r, sigma)
+    return K * np.exp(- r * T) * norm_cdf(-d2) - S * norm_cdf(-d1)
 
+def straddle(S, K, T, r, sigma):
+    d1, d2 = _d1_d2(S, K, T, r, sigma)
+    # call + put avec un seul calcul de d1 / d2 : N(x) - N(-x) = 2 N(x) - 1
+    return S * (2 * norm_cdf(d1) - 1) - K * np.exp(- r * T) * (2 * norm_cdf(d2) - 1)
+
+
+def black_scholes(S, K, T, r, sigma, right="C"):
+    """
+    Prix et grecques Black-Scholes en une passe, avec broadcasting NumPy sur tous les
+    arguments (S, K, T en années, r, sigma, right 'C' / 'P' ou tableau de types).
+    Conventions des fichiers market_data : theta par jour calendaire, vega pour +1 point
+    de volatilité. Options échues (T <= 0) ou à volatilité nulle : valeur intrinsèque
+    actualisée, delta 0 / ±1, autres grecques nulles.
+    Retourne un dict de tableaux : price, delta, gamma, vega, theta.
+    """
+    S, K, T, r, sigma = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64) for a in (S, K, T, r, sigma)))
+    is_call = np.broadcast_to(np.asarray(right) == "C", S.shape)
+    sign = np.where(is_call, 1.0, -1.0)
+    live = (T > 0) & (sigma > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sqrt_t = np.sqrt(np.where(live, T, 1.0))
+        vol = np.where(live, sigma, 1.0)
+        d1 = (np.log(S / K) + (r + vol**2/2) * np.where(live, T, 1.0)) / (vol * sqrt_t)
+        d2 = d1 - vol * sqrt_t
+        discount = np.exp(-r * np.maximum(T, 0))
+        pdf = norm_pdf(d1)
+        n1 = norm_cdf(sign * d1)
+        n2 = norm_cdf(sign * d2)
+
+        price = sign * (S * n1 - K * discount * n2)
+        delta = sign * n1
+        gamma = pdf / (S * vol * sqrt_t)
+        vega = S * pdf * sqrt_t / 100
+        theta = (-S * pdf * vol / (2 * sqrt_t) - sign * r * K * discount * n2) / 365
+
+    intrinsic = np.maximum(sign * (S - K * discount), 0.0)
+    in_money = sign * (S - K * discount) > 0
+    return {
+        "price": np.where(live, price, intrinsic),
+        "delta": np.where(live, delta, np.where(in_money, sign, 0.0)),
+        "gamma": np.where(live, gamma, 0.0),
+        "vega": np.where(live, vega, 0.0),
+        "theta": np.where(live, theta, 0.0),
+    }
+
+
+def implied_volatility(price, S, K, T, r, right, tol=1e-8, max_iter=50, sig_low=1e-8, sig_high=10.0):
+    """
+    Volatilités implicites Black-Scholes d'une chaîne entière (tableaux, broadcasting).
+    Point de départ rationnel (Corrado-Miller), puis Newton vectorisé protégé par un
+    encadrement [sig_low, sig_high] : un pas qui en sort, ou un vega trop faible, est
+    remplacé par une bissection.
+    Les prix hors des bornes de non-arbitrage (valeur intrinsèque actualisée, S pour un
+    call, K e^{-rT} pour un put) ou hors de [prix(sig_low), prix(sig_high)] donnent NaN.
+    Retourne (iv, converged) : converged indique les éléments résolus à `tol` près (sur le prix).
+    """
+    price, S, K, T, r = np.broadcast_arrays(*(np.asarray(a, dtype=np.float64) for a in (price, S, K, T, r)))
+    sign = np.broadcast_to(np.where(np.asarray(right) == "C", 1.0, -1.0), price.shape)
+    shape = price.shape
+    price, S, K, T, r, sign = (a.ravel() for a in (price, S, K, T, r, sign))
+
+    discount = K * np.exp(-r * np.maximum(T, 0))
+    lower = np.maximum(sign * (S - discount), 0.0)
+    upper = np.where(sign > 0, S, discount)
+    valid = (price > 0) & (T > 0) & (price >= lower - 1e-12) & (price < upper) & np.isfinite(price)
+
+    iv = np.full(price.shape, np.nan)
+    converged = np.zeros(price.shape, dtype=bool)
+    idx = np.flatnonzero(valid)
+    if len(idx):
+        p, s, k, t, rr, sg, x = price[idx], S[idx], K[idx], T[idx], r[idx], sign[idx], discount[idx]
+        lo = np.full(len(idx), sig_low)
+        hi = np.full(len(idx), sig_high)
+        # prix hors de ce qu'atteint l'intervalle de volatilités : pas de solution
+        reachable = (_bs_price_vega(s, k, t, rr, lo, sg)[0] <= p + tol) & (_bs_price_vega(s, k, t, rr, hi, sg)[0] >= p - tol)
+
+        # Corrado-Miller sur le call équivalent (parité call-put)
+        c = np.where(sg > 0, p, p + s - x)
+        half = c - (s - x) / 2
+        guess = np.sqrt(2 * np.pi / t) / (s + x) * (half + np.sqrt(np.maximum(half**2 - (s - x)**2 / np.pi, 0.0)))
+        sigma = np.clip(np.where(np.isfinite(guess) & (guess > 0), guess, 0.3), lo, hi)
+
+        active = reachable.copy()
+        done = np.zeros(len(idx), dtype=bool)
+        for _ in range(max_iter):
+            a = np.flatnonzero(active)
+            if not len(a):
+                break
+            model, vega = _bs_price_vega(s[a], k[a], t[a], rr[a], sigma[a], sg[a])
+            diff = model - p[a]
+            ok = np.abs(diff) < tol
+            done[a[ok]] = True
+            hi[a] = np.where(diff > 0, sigma[a], hi[a])
+            lo[a] = np.where(diff > 0, lo[a], sigma[a])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                newton = sigma[a] - diff / vega
+            inside = np.isfinite(newton) & (newton > lo[a]) & (newton < hi[a])
+            step = np.where(inside, newton, 0.5 * (lo[a] + hi[a]))
+            sigma[a] = np.where(ok, sigma[a], step)
+            # encadrement réduit à rien : la volatilité est déterminée à la précision machine
+            collapsed = hi[a] - lo[a] < 1e-14 * np.maximum(hi[a], 1.0)
+            done[a[collapsed]] = True
+            active[a[ok | collapsed]] = False
+
+        iv[idx] = np.where(reachable, sigma, np.nan)
+        converged[idx] = done & reachable
+    return iv.reshape(shape), converged.reshape(shape)
+
+
+def _bs_price_vega(S, K, T, r, sigma, sign):
+    # prix et vega (par unité de volatilité) pour Newton, sans les autres grecques
+    sqrt_t = np.sqrt(T)
+    d1 = (np.log(S / K) + (r + sigma**2/2) * T) / (sigma * sqrt_t)
+    d2 = d1 - sigma * sqrt_t
+    price = sign * (S * norm_cdf(sign * d1) - K * np.exp(-r * T) * norm_cdf(sign * d2))
+    return price, S * norm_pdf(d1) * sqrt_t
+
+
+def chain_implied_volatility(chain, r, price="mid", **kwargs):
+    """
+    Recalcule la volatilité implicite de lignes market_data (date, expiration, type,
+    strike, spot, bid, ask, last). price : "mid" ((bid+ask)/2, last si pas de fourchette) ou
+    nom d'une colonne de prix. r : scalaire ou un taux par ligne.
+    Retourne une copie avec les colonnes iv_bs et iv_converged.
+    """
+    chain = chain.copy()
+    T = (pd.to_datetime(chain["expiration"], format="ISO8601")
+         - pd.to_datetime(chain["date"], format="ISO8601")).dt.days.to_numpy() / 365
+    if price == "mid":
+        quoted = (chain["bid"] > 0) & (chain["ask"] > 0)
+        target = np.where(quoted, (chain["bid"] + chain["ask"]) / 2, chain["last"])
+    else:
+        target = chain[price].to_numpy()
+    chain["iv_bs"], chain["iv_converged"] = implied_volatility(
+        target, chain["spot"].to_numpy(), chain["strike"].to_numpy(), T, r, chain["type"].to_numpy(), **kwargs
+    )
+    return chain
 
 
+def compute_iv(price_market, S, K, T, r, right,
+               tol=1e-6, max_iter=100,
+               sig_low=1e-8, sig_high=10.0):
+    # version une option de implied_volatility (NaN si pas de solution)
+    iv, converged = implied_volatility(price_market, S, K, T, r, right, tol=tol, max_iter=max_iter,
+                                       sig_low=sig_low, sig_high=sig_high)
+    return float(iv) if converged else np.nan
+
+
+def _benchmark(ticker="NVDA", rate=0.04, repeat=3):
+    """ Compare black_scholes aux anciennes fonctions (scipy.stats.norm, option par option). """
+    import time
+    from scipy.stats import norm
+
+    def call_ref(S, K, T, r, sigma):
+        d1 = (np.log(S / K) + (r + sigma**2/2) * T) / (sigma * np.sqrt(T))
+        d2 = d1 - sigma * np.sqrt(T)
+        return S * norm.cdf(d1) - K * np.exp(- r * T) * norm.cdf(d2)
+
+    def put_ref(S, K, T, r, sigma):
+        d1 = (np.log(S / K) + (r + sigma**2/2) * T) / (sigma * np.sqrt(T))
+        d2 = d1 - sigma * np.sqrt(T)
+        return K * np.exp(- r * T) * norm.cdf(-d2) - S * norm.cdf(-d1)
+
+    from utils.option_store import OptionStore
+
+    df = OptionStore().read(ticker, columns=["expiration", "spot", "strike", "iv", "type"])
+    df["T"] = (df["expiration"] - df["date"]).dt.days / 365
+    df = df[(df["T"] > 0) & (df["iv"] > 0)]
+    T = df["T"].to_numpy()
+    S, K, right = df["spot"].to_numpy(), df["strike"].to_numpy(), df["type"].to_numpy()
+    sigma = df["iv"].to_numpy(np.float64)
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        ref = np.array([(call_ref if c == "C" else put_ref)(s, k, t, rate, v) for s, k, t, v, c in zip(S, K, T, sigma, right)])
+    scalar = (time.perf_counter() - start) / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        greeks = black_scholes(S, K, T, rate, sigma, right)
+    vectorized = (time.perf_counter() - start) / repeat
+    print(f"{len(S)} options | scipy.stats scalaire : {scalar*1e3:.1f} ms | black_scholes : {vectorized*1e3:.2f} ms "
+          f"(x{scalar/vectorized:.0f}, prix + 4 grecques) | écart max : {np.nanmax(np.abs(greeks['price'] - ref)):.2e}")
+
+    start = time.perf_counter()
+    iv, converged = implied_volatility(greeks["price"], S, K, T, rate, right)
+    solve = time.perf_counter() - start
+    recovered = converged & (np.abs(iv - sigma) < 1e-4)
+    print(f"implied_volatility : {solve*1e3:.1f} ms pour la chaîne | convergées : {converged.mean():.1%} "
+          f"| volatilité retrouvée à 1e-4 : {recovered.mean():.1%}")
+
+
+if __name__ == "__main__":
+    _benchmark()
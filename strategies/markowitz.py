@@ -1,5 +1,5 @@
 from strategies.base import BaseStrategy
-from utils.data_handler import DataHandler
+from utils.data_handler import get_data_handler
 import pandas as pd
 import numpy as np
 import cvxpy as cp
@@ -12,24 +12,95 @@ from strategies.buy_and_hold import BuyAndHold
 from tqdm import tqdm
 import sys 
 import tracemalloc
-from utils.config_loader import load_yaml
+from utils.rolling import RollingMoments
+
+# (actifs, estimateur, fenêtre de lookback, données) -> (rendements moyens, covariance) annualisés
+_moments_cache = {}
+
+class FrontierSolver:
+    """
+    Problème de Markowitz compilé une seule fois (DPP) puis résolu pour chaque gamma et
+    chaque date de rééquilibrage en ne changeant que les paramètres.
+    La variance passe par le facteur de Cholesky (w' S w = ||L' w||^2) et gamma * mu est
+    un seul paramètre, sinon le problème n'est pas DPP et cvxpy recanonicalise à chaque solve.
+    """
+
+    def __init__(self, n, diversification):
+        self.n = n
+        self.w = cp.Variable(n)
+        self.chol = cp.Parameter((n, n))
+        self.gamma_mu = cp.Parameter(n)
+        variance = cp.sum_squares(self.chol.T @ self.w)
+        constraints = [
+            cp.sum(self.w) == 1,
+            self.w >= 0,
+            n * cp.sum_squares(self.w) <= 1/diversification
+        ]
+        self.problem = cp.Problem(cp.Minimize(variance - self.gamma_mu @ self.w), constraints)
+
+        # max Sharpe direct : min y'Sy  s.c. (mu - rf)'y = 1, y >= 0, w = y / sum(y)
+        # la contrainte n*sum(w^2) <= 1/div devient ||y|| <= sqrt(1/(n*div)) * sum(y)
+        self.y = cp.Variable(n)
+        self.excess = cp.Parameter(n)
+        self.sharpe_problem = cp.Problem(
+            cp.Minimize(cp.sum_squares(self.chol.T @ self.y)),
+            [
+                self.excess @ self.y == 1,
+                self.y >= 0,
+                cp.norm(self.y, 2) <= np.sqrt(1/(n*diversification)) * cp.sum(self.y)
+            ]
+        )
+
+    def set_moments(self, cov_matrix):
+        cov_matrix = np.asarray(cov_matrix, dtype=np.float64)
+        try:
+            self.chol.value = np.linalg.cholesky(cov_matrix)
+        except np.linalg.LinAlgError:
+            # covariance seulement semi-définie (actifs colinéaires, prix constant) :
+            # racine par valeurs propres, L = V sqrt(max(lambda, 0)) vérifie L L' = S
+            eigenvalues, eigenvectors = np.linalg.eigh(cov_matrix)
+            self.chol.value = eigenvectors * np.sqrt(np.clip(eigenvalues, 0, None))
+
+    def solve(self, gamma, expected_returns):
+        self.gamma_mu.value = gamma * np.asarray(expected_returns)
+        self.problem.solve(warm_start=True)
+        return None if self.w.value is None else self.w.value.copy()
+
+    def max_sharpe(self, mean_returns, risk_free_rate):
+        excess = np.asarray(mean_returns) - risk_free_rate
+        if not (excess > 0).any():
+            return None
+        self.excess.value = excess
+        self.sharpe_problem.solve(warm_start=True)
+        if self.y.value is None:
+            return None
+        y = np.maximum(self.y.value, 0)
+        return y / y.sum()
+
 
 class Markowitz(BaseStrategy):
-    def __init__(self, assets):
-        super().__init__()
-        self.config = load_yaml('config/markowitz.yaml')
+    def __init__(self, assets, params=None, save_outputs=True, period=None):
+        super().__init__(period)
+        self.config = self.load_config('config/markowitz.yaml', params)
+        self.save_outputs = save_outputs
         self.name = "Markowitz Strategy"
         self.allocation_window = self.config["rebalance_window"]
         self.lookback_window = self.config["lookback_window"]
         self.risk_free_rate = self.config["risk_free_rate"]
         self.diversification = self.config["diversification"]
-        self.data_handler = DataHandler(data_path = "data/etf.pkl")
+        # "frontier" : balayage de 100 gammas, "max_sharpe" : un seul problème convexe
+        self.sharpe_solver = self.config.get("sharpe_solver", "frontier")
+        # "rolling" : moments mis à jour d'un rééquilibrage à l'autre, "sklearn" : LedoitWolf().fit
+        self.covariance_estimator = self.config.get("covariance_estimator", "rolling")
+        self._rolling_window = None
+        self.data_handler = get_data_handler("data/etf.pkl")
         self.dates = self.data_handler.get(assets[0], start=self.start, end=self.end).index
         self.assets = assets
+        self.solver = FrontierSolver(len(assets), self.diversification)
         
 
     
-    def generate_orders(self, plot=False):
+    def simulate(self):
         orders = {} 
         gamma_series = {}
         mask = [i % self.allocation_window == 0 for i in range(len(self.dates))]
@@ -38,11 +109,13 @@ class Markowitz(BaseStrategy):
         prices_df = self.data_handler.get_multiple_df(list(self.assets), price='Adj Close', start=pre_start)    
         prices_df_open = self.data_handler.get_multiple_df(list(self.assets), price='Open', start=pre_start)  
         weights_hist = [[0]*len(self.assets)]
-        portfolio = Portfolio(symbols=self.assets, data_handler=self.data_handler, strategy=self)
+        # portfolio.value sert à dimensionner les ordres pendant la boucle : moteur itératif
+        portfolio = Portfolio(symbols=self.assets, data_handler=self.data_handler, strategy=self, engine="loop")
+        self._rolling_window = None
         executor = OrderExecutor(data_handler=self.data_handler)
         total_fees = 0
         executed_orders = {}
-        for i, date in enumerate(tqdm(self.dates[:-1], desc="Backtesting")):
+        for i, date in enumerate(tqdm(self.dates[:-1], desc="Backtesting", disable=not self.save_outputs)):
             next_date = self.dates[i+1]
             day_orders = []
             idx = prices_df[self.assets[0]].index.get_loc(date)
@@ -73,6 +146,14 @@ class Markowitz(BaseStrategy):
             portfolio.update(date, executed)           
         portfolio_df = portfolio.get_history()
         analyzer = PerformanceAnalyzer(self.data_handler, portfolio_df, orders, strategy=self)
+        return analyzer, executed_orders, total_fees
+
+    def backtest_statistics(self):
+        self.analyzer, _, total_fees = self.simulate()
+        return self.analyzer.compute_statistics(total_fees)
+
+    def generate_orders(self, plot=False):
+        analyzer, executed_orders, total_fees = self.simulate()
         stats = analyzer.compute_statistics(total_fees)
         stats_df = pd.DataFrame.from_dict(stats, orient='index', columns=["Portefeuille"])
         benchmark_portfolio_df, benchmark_stats_df = self.run_benchmark(preset='SPY')
@@ -90,50 +171,80 @@ class Markowitz(BaseStrategy):
         
      
     def markowitz_optimize(self, gamma, mean_returns, cov_matrix):
-        n = len(mean_returns)
-        w = cp.Variable(n)
-        
+        self.solver.set_moments(cov_matrix)
+        return self.solver.solve(gamma, self.shrink_returns(mean_returns))
+
+    def shrink_returns(self, mean_returns):
         global_mean = mean_returns.mean()
         shrinkage_level = 0.5
-        shrunk_returns = (1 - shrinkage_level) * mean_returns + shrinkage_level * global_mean
-        expected_returns = w @ shrunk_returns
-        variance = cp.quad_form(w, cov_matrix)
-        objective = cp.Minimize(variance - gamma * expected_returns)
-        
-        div_proxy = n * cp.sum_squares(w)
-        constraints = [
-            cp.sum(w) == 1,
-            w >= 0,
-            div_proxy <= 1/self.diversification
-        ]
-        
-        problem = cp.Problem(objective, constraints)
-        problem.solve()
-        weights = w.value
-        return weights
+        return (1 - shrinkage_level) * mean_returns + shrinkage_level * global_mean
     
+    def estimate_moments(self, data):
+        # les fenêtres sont identiques d'un run à l'autre d'un sweep / d'un fold à l'autre
+        # d'un walk-forward : l'estimation est faite une fois par fenêtre
+        key = (tuple(self.assets), self.covariance_estimator, data.index[0], data.index[-1], len(data),
+               self.data_handler, self.data_handler.mtime)
+        if key not in _moments_cache:
+            if len(_moments_cache) >= 4096:
+                _moments_cache.clear()
+            if self.covariance_estimator == "rolling":
+                mean_returns, cov_matrix = self.rolling_moments(data)
+            else:
+                returns = data.pct_change().dropna()
+                lw = LedoitWolf().fit(returns.values)
+                mean_returns, cov_matrix = returns.mean().values, lw.covariance_
+            _moments_cache[key] = (mean_returns * 252, cov_matrix * 252)
+        mean_returns, cov_matrix = _moments_cache[key]
+        return mean_returns.copy(), cov_matrix.copy()
+
+    def rolling_moments(self, data):
+        """
+        Moyenne et covariance Ledoit-Wolf de data.pct_change().dropna() en faisant glisser
+        la fenêtre précédente : seuls les rendements sortis / entrés depuis le dernier
+        rééquilibrage sont retirés / ajoutés aux sommes courantes.
+        """
+        returns = data.pct_change().to_numpy()
+        dates = data.index
+        window = self._rolling_window
+        # la 1re ligne de chaque fenêtre (rendement NaN) est ignorée par RollingMoments
+        if window is not None and dates[0] in window[0] and window[0][-1] in dates:
+            prev_dates, prev_returns, moments = window
+            moments.remove(prev_returns[prev_dates <= dates[0]])
+            moments.add(returns[dates > prev_dates[-1]])
+        else:
+            moments = RollingMoments(len(self.assets))
+            moments.add(returns)
+        self._rolling_window = (dates, returns, moments)
+        cov_matrix, _ = moments.ledoit_wolf()
+        return moments.mean(), cov_matrix
+
     def optimize_sharpe(self, data):
-        returns = data.pct_change().dropna()
-        lw = LedoitWolf().fit(returns.values)
-        cov_matrix = lw.covariance_ * 252
-        mean_returns = returns.mean().values * 252
+        mean_returns, cov_matrix = self.estimate_moments(data)
+        self.solver.set_moments(cov_matrix)
+        if self.sharpe_solver == "max_sharpe":
+            weights = self.solver.max_sharpe(mean_returns, self.risk_free_rate)
+            if weights is not None:
+                return weights, self.sharpe_ratio(weights, mean_returns, cov_matrix), np.nan
+        shrunk_returns = self.shrink_returns(mean_returns)
         gamma_list = np.linspace(0,1,100)
         best_sharpe = -np.inf
         best_weights = None
         best_gamma = None
         for gamma in gamma_list:
-            weights = self.markowitz_optimize(gamma, mean_returns, cov_matrix)
-            port_return = np.dot(weights, mean_returns)
-            port_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
-            sharpe = (port_return - self.risk_free_rate) / port_vol if port_vol > 0 else -np.inf
+            weights = self.solver.solve(gamma, shrunk_returns)
+            sharpe = self.sharpe_ratio(weights, mean_returns, cov_matrix)
             if sharpe > best_sharpe:
                 best_sharpe = sharpe
                 best_weights = weights
                 best_gamma = gamma
         return best_weights, best_sharpe, best_gamma
+
+    def sharpe_ratio(self, weights, mean_returns, cov_matrix):
+        port_return = np.dot(weights, mean_returns)
+        port_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
+        return (port_return - self.risk_free_rate) / port_vol if port_vol > 0 else -np.inf
         
 
     def run_benchmark(self, preset='SPY'):
-        strategy = BuyAndHold(preset=preset)
-        return strategy.run_benchmark(preset=preset)
+        return BuyAndHold(preset=preset, period=(self.start, self.end)).cached_benchmark(preset=preset)
             
@@ -0,0 +1,164 @@
+from strategies.base import BaseStrategy
+from strategies.pairs_trading import PairsTradingStrategy
+from core.compute_performance import batch_statistics
+from utils.data_handler import DataHandler, get_data_handler
+from utils.price_store import SharedPriceStore
+from utils.config_loader import load_yaml
+from concurrent.futures import ProcessPoolExecutor
+from statsmodels.tsa.adfvalues import mackinnonp
+from tabulate import tabulate
+from tqdm import tqdm
+import pandas as pd
+import numpy as np
+import os
+
+# handler des workers, rattaché au bloc de mémoire partagée par _init_worker
+_worker_handler = None
+
+
+def _init_worker(spec):
+    global _worker_handler
+    _worker_handler = DataHandler.from_store(SharedPriceStore(*spec))
+
+
+def _backtest_pairs(pairs):
+    # un lot de paires par tâche : les statistiques du lot sont calculées en une passe
+    # vectorisée (batch_statistics) au lieu d'un PerformanceAnalyzer par paire
+    rows, curves = [], []
+    for pair in pairs:
+        strategy = PairsTradingStrategy(pair, data_handler=_worker_handler, save_outputs=False)
+        portfolio_df, _, executed_orders = strategy.simulate_portfolio()
+        spread = strategy.signals["spread"]
+        rows.append({
+            "pair": f"{pair[0]},{pair[1]}",
+            "Trades": sum(1 for day in executed_orders.values() for order in day if order["action"] != "exit") // 2,
+            "Hedge Ratio": round(strategy.signals["beta"].iloc[-1], 3) if len(spread) else np.nan,
+            "Half-Life": round(half_life(spread), 1),
+        })
+        curves.append((portfolio_df["value"].to_numpy(), portfolio_df[list(pair)].to_numpy()))
+
+    # courbes de même longueur empilées ensemble (les historiques peuvent différer d'une paire à l'autre)
+    stats = [None] * len(pairs)
+    for length in {len(values) for values, _ in curves}:
+        members = [i for i, (values, _) in enumerate(curves) if len(values) == length]
+        table = batch_statistics(
+            np.stack([curves[i][0] for i in members]),
+            positions=np.stack([curves[i][1] for i in members]),
+            symbols=[list(pairs[i]) for i in members],
+        )
+        for i, row in zip(members, table.to_dict("records")):
+            stats[i] = row
+    return [{"pair": row["pair"], **stat, **{k: v for k, v in row.items() if k != "pair"}}
+            for row, stat in zip(rows, stats)]
+
+
+def half_life(spread):
+    # ds_t = lambda * s_{t-1} + c  ->  demi-vie = -ln(2) / lambda
+    s = np.asarray(spread, dtype=np.float64)
+    if len(s) < 3:
+        return np.nan
+    lagged = s[:-1] - s[:-1].mean()
+    delta = np.diff(s)
+    lam = np.dot(lagged, delta - delta.mean()) / np.dot(lagged, lagged)
+    return -np.log(2) / lam if lam < 0 else np.nan
+
+
+def engle_granger(prices, pairs):
+    """
+    Test d'Engle-Granger vectorisé sur toutes les paires candidates : régression
+    statique y = a + b x puis Dickey-Fuller (sans retard) sur les résidus.
+    prices : (dates x symboles), pairs : (k x 2) indices de colonnes.
+    Retourne beta, la statistique DF et la p-value MacKinnon (N=2) par paire.
+    """
+    x = prices[:, pairs[:, 0]]
+    y = prices[:, pairs[:, 1]]
+    x_c = x - x.mean(axis=0)
+    y_c = y - y.mean(axis=0)
+    beta = (x_c * y_c).sum(axis=0) / (x_c ** 2).sum(axis=0)
+    resid = y_c - beta * x_c
+    lagged = resid[:-1]
+    delta = np.diff(resid, axis=0)
+    sxx = (lagged ** 2).sum(axis=0)
+    rho = (lagged * delta).sum(axis=0) / sxx
+    sigma2 = ((delta - rho * lagged) ** 2).sum(axis=0) / (len(delta) - 1)
+    stat = rho / np.sqrt(sigma2 / sxx)
+    pvalue = np.array([mackinnonp(t, regression="c", N=2) for t in stat])
+    return beta, stat, pvalue
+
+
+class PairsScanner(BaseStrategy):
+    def __init__(self, universe=None):
+        super().__init__()
+        self.name = "Pairs Trading Strategy"
+        self.config = load_yaml("config/pairs_trading.yaml")
+        self.window = self.config["window"]
+        self.min_correlation = self.config.get("scan_min_correlation", 0.9)
+        self.max_pvalue = self.config.get("scan_max_pvalue", 0.05)
+        self.workers = self.config.get("scan_workers") or os.cpu_count()
+        self.data_handler = get_data_handler("data/s&p500.pkl")
+        # sous-univers (ex: un secteur) : liste de symboles, sinon tout le fichier
+        self.universe = universe or self.config.get("scan_universe") or self._all_symbols()
+
+    def _all_symbols(self):
+        if self.data_handler.store is not None:
+            return self.data_handler.store.symbols
+        return list(self.data_handler.load_data().columns.get_level_values(0).unique())
+
+    def candidate_pairs(self):
+        # même historique que compute_spread : 2 ans avant le début pour la fenêtre de régression
+        pre_start = self.start - pd.Timedelta(days=2*365)
+        closes = self.data_handler.get_multiple_df(list(self.universe), 'Close', start=pre_start, end=self.end)
+        closes = closes.loc[:, closes.notna().all()]
+        symbols = list(closes.columns)
+        log_prices = np.log(closes.loc[self.start:].to_numpy())
+
+        corr = np.corrcoef(log_prices, rowvar=False)
+        i, j = np.triu_indices(len(symbols), k=1)
+        keep = corr[i, j] >= self.min_correlation
+        pairs = np.column_stack([i[keep], j[keep]])
+        if len(pairs) == 0:
+            return pd.DataFrame(columns=["s1", "s2", "Correlation", "EG beta", "EG stat", "EG p-value"])
+
+        beta, stat, pvalue = engle_granger(log_prices, pairs)
+        candidates = pd.DataFrame({
+            "s1": np.array(symbols)[pairs[:, 0]],
+            "s2": np.array(symbols)[pairs[:, 1]],
+            "Correlation": corr[pairs[:, 0], pairs[:, 1]].round(3),
+            "EG beta": beta.round(3),
+            "EG stat": stat.round(2),
+            "EG p-value": pvalue.round(4),
+        })
+        return candidates[candidates["EG p-value"] <= self.max_pvalue].reset_index(drop=True)
+
+    def run_scan(self):
+        candidates = self.candidate_pairs()
+        print(f"{len(candidates)} paires retenues après pré-filtre (corrélation, Engle-Granger)")
+        if candidates.empty:
+            return candidates
+
+        symbols = list(dict.fromkeys(candidates["s1"].tolist() + candidates["s2"].tolist()))
+        pre_start = self.start - pd.Timedelta(days=2*365)
+        store = SharedPriceStore.from_handler(
+            self.data_handler, symbols, ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume'], start=pre_start, end=self.end
+        )
+        pairs = list(zip(candidates["s1"], candidates["s2"]))
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker, initargs=(store.spec(),)) as pool:
+                batches = [pairs[i:i + 64] for i in range(0, len(pairs), 64)]
+                results = [row for batch in tqdm(pool.map(_backtest_pairs, batches), total=len(batches), desc="Scan")
+                           for row in batch]
+        finally:
+            store.close(unlink=True)
+
+        results = pd.DataFrame(results)
+        candidates["pair"] = candidates["s1"] + "," + candidates["s2"]
+        table = (
+            candidates.drop(columns=["s1", "s2"])
+            .merge(results, on="pair")
+            .set_index("pair")
+            .sort_values("Sharpe Ratio", ascending=False)
+        )
+        os.makedirs(f"output/{self.name}", exist_ok=True)
+        table.to_csv(f"output/{self.name}/pairs_scan.csv")
+        print(tabulate(table.head(20), headers="keys", tablefmt="fancy_grid"))
+        return table
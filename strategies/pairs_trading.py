@@ -1,6 +1,5 @@
-import statsmodels.api as sm
 from strategies.base import BaseStrategy
-from utils.data_handler import DataHandler
+from utils.data_handler import get_data_handler
 import pandas as pd
 from core.portfolio import Portfolio
 from core.execution import OrderExecutor
@@ -11,93 +10,108 @@ import sys
 import os
 import json
 import numpy as np
-from utils.config_loader import load_yaml
+from utils.rolling import rolling_ols
+
+# (paire, window, données) -> (dates de cotation couvertes, spread / beta)
+_spread_cache = {}
+
+def hysteresis_signals(z, z_enter, z_exit):
+    """
+    Signaux long / short / exit d'une stratégie à hystérésis sur un tableau de z-scores.
+    Hors position : short si z > z_enter, long si z < -z_enter.
+    En position : exit si |z| < z_exit.
+    """
+    z = np.asarray(z, dtype=np.float64)
+    enter = np.abs(z) > z_enter
+    leave = np.abs(z) < z_exit
+    if not (enter & leave).any():
+        # entrée et sortie exclusives : l'état après chaque date est le dernier événement (ffill)
+        event = np.where(enter, 1.0, np.where(leave, 0.0, np.nan))
+        state = pd.Series(event).ffill().fillna(0.0).to_numpy().astype(bool)
+    else:
+        # bandes qui se chevauchent (z_exit > z_enter) : l'état bascule, on déroule la machine
+        state = _hysteresis_state(enter, leave)
+    prev = np.concatenate([[False], state[:-1]])
+    short = ~prev & (z > z_enter)
+    long = ~prev & (z < -z_enter)
+    exit = prev & leave
+    return long, short, exit
+
+
+def _hysteresis_state(enter, leave):
+    state = np.zeros(len(enter), dtype=bool)
+    in_position = False
+    for i in range(len(enter)):
+        in_position = not leave[i] if in_position else bool(enter[i])
+        state[i] = in_position
+    return state
+
 
 class PairsTradingStrategy(BaseStrategy):
-    def __init__(self, pair):
-        super().__init__()
+    def __init__(self, pair, data_handler=None, save_outputs=True, params=None, period=None):
+        super().__init__(period)
         self.name = "Pairs Trading Strategy"
-        self.config = load_yaml("config/pairs_trading.yaml")
+        self.config = self.load_config("config/pairs_trading.yaml", params)
         self.pair   = pair
         self.window  = self.config["window"]
         self.z_enter = self.config["z_enter"]
         self.z_exit  = self.config["z_exit"]
-        self.data_handler =  DataHandler(data_path = "data/s&p500.pkl")
+        self.data_handler =  data_handler or get_data_handler("data/s&p500.pkl")
+        # désactivé par le scanner : pas de CSV par paire
+        self.save_outputs = save_outputs
     
     def generate_signals(self):     
         s1, s2 = self.pair
         df = self.compute_z_score()
-        z = df['z_score']
-        short = {}
-        long = {}
-        exit = {}
-        in_position = False
-        for current_date in z.index:
-            if not in_position:
-                if z.loc[current_date] > self.z_enter:
-                    short[current_date] = True
-                    long[current_date] = False
-                    exit[current_date] = False
-                    in_position = True
-                elif z.loc[current_date] < -self.z_enter:
-                    short[current_date] = False
-                    long[current_date] = True
-                    exit[current_date] = False
-                    in_position = True 
-                else:
-                    short[current_date] = False
-                    long[current_date] = False
-                    exit[current_date] = False
-                    in_position = False 
-            else:
-                if abs(z.loc[current_date]) < self.z_exit: 
-                    short[current_date] = False
-                    long[current_date] = False
-                    exit[current_date] = True
-                    in_position = False
-                else:
-                    short[current_date] = False
-                    long[current_date] = False
-                    exit[current_date] = False
-                    in_position = True   
+        long, short, exit = hysteresis_signals(df['z_score'].to_numpy(), self.z_enter, self.z_exit)
         signals = pd.DataFrame({
-        "short": pd.Series(short),
-        "long": pd.Series(long),
-        "exit": pd.Series(exit),
-        })     
+        "short": short,
+        "long": long,
+        "exit": exit,
+        }, index=df.index)
         df = df.join(signals, how='left')
         data = self.data_handler.get_multiple([s1, s2], price='Close')
         df1, df2 = data[s1], data[s2]
         df["close_1"] = df1.loc[df.index]
         df["close_2"] = df2.loc[df.index]
-        df.to_csv(f'output/{self.name}/{s1}_{s2}_signals.csv')
+        if self.save_outputs:
+            df.to_csv(f'output/{self.name}/{s1}_{s2}_signals.csv')
         return df
 
 
     def compute_spread(self):
-        s1, s2 = self.pair
-        spread = {}
-        betas = {}
+        # Le spread ne dépend ni de z_enter ni de z_exit : partagé entre les runs d'un sweep.
+        # Il est calculé une fois jusqu'à la fin de general.yaml puis découpé : les folds d'un
+        # walk-forward réutilisent les régressions déjà faites au lieu de tout recalculer.
         pre_start = self.start - pd.Timedelta(days=2*365)
-        df = self.data_handler.get_multiple([s1, s2], start=pre_start, end=self.end)
+        key = (tuple(self.pair), self.window, self.data_handler, self.data_handler.mtime)
+        cached = _spread_cache.get(key)
+        if cached is None or cached[0][0] > pre_start or cached[0][-1] < self.end:
+            span_start = pre_start if cached is None else min(pre_start, cached[0][0])
+            span_end = max(self.end, pd.Timestamp(self.general_config["end_date"]))
+            if len(_spread_cache) >= 256:
+                _spread_cache.clear()
+            _spread_cache[key] = self._compute_spread(span_start, span_end)
+        dates, df = _spread_cache[key]
+        # même découpage qu'un calcul direct depuis pre_start : la première régression
+        # se termine sur la `window`-ième cotation à partir de pre_start
+        first = dates.searchsorted(pre_start)
+        return df.iloc[first:].loc[:self.end].copy()
+
+    def _compute_spread(self, start, end):
+        s1, s2 = self.pair
+        df = self.data_handler.get_multiple([s1, s2], start=start, end=end)
         df1, df2 = df[s1], df[s2]
         dates = df1.index[self.window-1:]
-        for i, current_date in enumerate(dates, start=self.window):
-            close1 = df1['Close'].iloc[i - self.window : i]
-            close2 = df2['Close'].iloc[i - self.window : i]   
-            X_reg   = sm.add_constant(close1)
-            model = sm.OLS(close2, X_reg).fit()
-            beta = model.params.iloc[1]
-            alpha = model.params.iloc[0]
-            spread_val = close2.iloc[-1] - (alpha + beta * close1.iloc[-1])
-            spread[current_date] = spread_val
-            betas[current_date] = beta
+        close1 = df1['Close'].to_numpy()
+        close2 = df2['Close'].to_numpy()
+        alpha, beta = rolling_ols(close1, close2, self.window)
+        spread = close2[self.window-1:] - (alpha + beta * close1[self.window-1:])
         df_result = pd.DataFrame({
-        "spread": pd.Series(spread),
-        "beta": pd.Series(betas)
+        "spread": pd.Series(spread, index=dates, dtype=float),
+        "beta": pd.Series(beta, index=dates, dtype=float)
         })
-        df_result = df_result
-        return df_result
+        return df1.index, df_result
     
     def compute_z_score(self):
         df = self.compute_spread()
@@ -106,54 +120,58 @@ class PairsTradingStrategy(BaseStrategy):
         df = df.loc[self.start:]
         return df
     
-    def generate_orders(self):
+    def generate_orders(self, df=None):
         s1, s2 = self.pair
-        df = self.generate_signals()
+        if df is None:
+            df = self.generate_signals()
         orders = {}  
-        dates = df.index.to_list()
-        for i in range(len(dates)-1):
-            date = dates[i]
+        dates = df.index
+        beta = df['beta'].to_numpy()
+        close1 = df['close_1'].to_numpy()
+        close2 = df['close_2'].to_numpy()
+        n_spread = self.capital/(close2+np.abs(beta)*close1)
+        exposure1 = n_spread * np.abs(beta) * close1
+        exposure2= n_spread * close2
+        qty1 = exposure1 / close1
+        qty2 = exposure2 / close2
+        long, short, exit = df["long"].to_numpy(), df["short"].to_numpy(), df["exit"].to_numpy()
+        # la dernière date n'a pas de lendemain pour exécuter
+        for i in np.flatnonzero((long | short | exit)[:-1]):
             next_date = dates[i+1]
-            row = df.loc[date]
-            day_orders = []
-            beta = row['beta']
-            close1 = row['close_1']
-            close2 = row['close_2']
-            n_spread = self.capital/(close2+abs(beta)*close1)
-            exposure1 = n_spread * abs(beta) * close1
-            exposure2= n_spread * close2
-            qty1 = int(exposure1 / close1)
-            qty2 = int(exposure2 / close2)
-            if row["long"]:
-                day_orders.append({'symbol': s1, 'action': 'sell',  'size': qty1})
-                day_orders.append({'symbol': s2, 'action': 'buy', 'size': qty2})
-            elif row["short"]:
-                day_orders.append({'symbol': s1, 'action': 'buy', 'size': qty1})
-                day_orders.append({'symbol': s2, 'action': 'sell',  'size': qty2})
-            elif row["exit"]:
-                day_orders.append({'symbol': s1, 'action': 'exit', 'size': qty1})
-                day_orders.append({'symbol': s2, 'action': 'exit', 'size': qty2})
-            if day_orders:
-                orders[next_date] = day_orders
+            size1, size2 = int(qty1[i]), int(qty2[i])
+            if long[i]:
+                orders[next_date] = [{'symbol': s1, 'action': 'sell',  'size': size1},
+                                     {'symbol': s2, 'action': 'buy', 'size': size2}]
+            elif short[i]:
+                orders[next_date] = [{'symbol': s1, 'action': 'buy', 'size': size1},
+                                     {'symbol': s2, 'action': 'sell',  'size': size2}]
+            else:
+                orders[next_date] = [{'symbol': s1, 'action': 'exit', 'size': size1},
+                                     {'symbol': s2, 'action': 'exit', 'size': size2}]
         return orders
     
     
-    def run_backtest(self, plot=False, benchmark=True):
+    def simulate_portfolio(self):
         executor = OrderExecutor(data_handler=self.data_handler)
-        signals = self.generate_signals()
-        orders = self.generate_orders()
+        self.signals = self.generate_signals()
+        orders = self.generate_orders(self.signals)
         portfolio = Portfolio(symbols=self.pair, data_handler=self.data_handler, strategy=self)
-        date_range = pd.date_range(start=self.start, end=self.end)
-        executed_orders = {}
-        for date in date_range:
-            if date not in signals.index:
-                continue
-            orders_today = orders.get(date, [])
-            executed = executor.execute(orders_today, date, order_time='Open')
-            executed_orders[date] = executed[date]
-            portfolio.update(date, executed)
-        portfolio_df = portfolio.get_history()
+        dates = self.signals.index[(self.signals.index >= self.start) & (self.signals.index <= self.end)]
+        executed_orders, self.trades_df = executor.execute_batch(orders, dates, order_time='Open')
+        portfolio_df = portfolio.run(dates, executed_orders)
+        return portfolio_df, orders, executed_orders
+
+    def simulate(self):
+        portfolio_df, orders, executed_orders = self.simulate_portfolio()
         analyzer = PerformanceAnalyzer(self.data_handler, portfolio_df, orders, strategy=self)
+        return analyzer, executed_orders
+
+    def backtest_statistics(self):
+        self.analyzer, _ = self.simulate()
+        return self.analyzer.compute_statistics()
+
+    def run_backtest(self, plot=False, benchmark=True):
+        analyzer, executed_orders = self.simulate()
         stats = analyzer.compute_statistics()
         stats_df = pd.DataFrame.from_dict(stats, orient='index', columns=["Portefeuille"])
         benchmark_portfolio_df, benchmark_stats_df = self.run_benchmark(preset='SPY')
@@ -169,7 +187,6 @@ class PairsTradingStrategy(BaseStrategy):
         
         
     def run_benchmark(self, preset='SPY'):
-        strategy = BuyAndHold(preset=preset)
-        return strategy.run_benchmark(preset=preset)
+        return BuyAndHold(preset=preset, period=(self.start, self.end)).cached_benchmark(preset=preset)
         
      
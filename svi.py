@@ -0,0 +1,261 @@
+import numpy as np
+
+# paramètres SVI "raw" d'une tranche : w(k) = a + b (rho (k - m) + sqrt((k - m)^2 + sigma^2)),
+# w = iv^2 T la variance totale, k = ln(K / S)
+PARAMS = ["a", "b", "rho", "m", "sigma"]
+RHO_MAX = 0.999
+
+
+def svi_total_variance(k, params):
+    """ params (..., 5) diffusé sur k (..., n) : variance totale w(k). """
+    a, b, rho, m, sigma = (params[..., i, None] for i in range(5))
+    x = k - m
+    return a + b * (rho * x + np.sqrt(x * x + sigma * sigma))
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+def _svi_from_free(u):
+    """
+    Paramètres libres -> SVI raw contraint : |rho| < 1, sigma > 0,
+    pentes des ailes b (1 + |rho|) <= 2 (Roger Lee), variance minimale a + b sigma sqrt(1 - rho^2) >= 0.
+    """
+    rho = RHO_MAX * np.tanh(u[..., 2])
+    b = 2.0 / (1.0 + np.abs(rho)) * _sigmoid(u[..., 1])
+    sigma = np.exp(u[..., 4]) + 1e-4
+    a = np.exp(u[..., 0]) - b * sigma * np.sqrt(1.0 - rho * rho)
+    return np.stack([a, b, rho, u[..., 3], sigma], axis=-1)
+
+
+def _svi_to_free(params):
+    a, b, rho, m, sigma = (params[..., i] for i in range(5))
+    rho = np.clip(rho, -RHO_MAX + 1e-9, RHO_MAX - 1e-9)
+    scaled_b = np.clip(b * (1.0 + np.abs(rho)) / 2.0, 1e-9, 1 - 1e-9)
+    floor = np.maximum(a + b * np.maximum(sigma - 1e-4, 1e-9) * np.sqrt(1.0 - rho * rho), 1e-10)
+    return np.stack([np.log(floor), np.log(scaled_b / (1 - scaled_b)), np.arctanh(rho / RHO_MAX),
+                     m, np.log(np.maximum(sigma - 1e-4, 1e-9))], axis=-1)
+
+
+def levenberg_marquardt(residuals, u0, max_iter=100, tol=1e-10, step=1e-6):
+    """
+    Moindres carrés non linéaires pour B problèmes indépendants à la fois : u0 (B, P),
+    residuals(u) -> (B, N) (zéros pour les points de remplissage). Jacobien par
+    différences finies, tout le lot avance ensemble, λ adapté problème par problème.
+    """
+    u = np.array(u0, dtype=np.float64)
+    n_batch, n_params = u.shape
+    r = residuals(u)
+    cost = np.einsum("bn,bn->b", r, r)
+    lam = np.full(n_batch, 1e-3)
+    active = np.ones(n_batch, dtype=bool)
+    eye = np.eye(n_params)
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        # jacobien : P évaluations décalées empilées dans le lot
+        shifted = u[:, None, :] + step * eye[None]
+        J = (residuals(shifted.reshape(-1, n_params)).reshape(n_batch, n_params, -1) - r[:, None, :]) / step
+        JtJ = np.einsum("bpn,bqn->bpq", J, J)
+        g = np.einsum("bpn,bn->bp", J, r)
+        A = JtJ + lam[:, None, None] * (np.diagonal(JtJ, axis1=1, axis2=2)[:, :, None] * eye + 1e-12 * eye)
+        delta = -np.linalg.solve(A, g[..., None])[..., 0]
+        candidate = np.where(active[:, None], u + delta, u)
+        r_new = residuals(candidate)
+        cost_new = np.einsum("bn,bn->b", r_new, r_new)
+        better = active & np.isfinite(cost_new) & (cost_new < cost)
+        converged = better & (cost - cost_new <= tol * np.maximum(cost, 1e-12))
+        u = np.where(better[:, None], candidate, u)
+        r = np.where(better[:, None], r_new, r)
+        cost = np.where(better, cost_new, cost)
+        lam = np.where(better, lam / 3, lam * 4)
+        active &= ~converged & (lam < 1e10)
+    return u, cost
+
+
+def _padded_slices(k, iv, T, min_quotes):
+    """ Regroupe les cotations par maturité en tableaux (tranches, cotations max) complétés par NaN. """
+    maturities, inverse, counts = np.unique(T, return_inverse=True, return_counts=True)
+    keep = counts >= min_quotes
+    order = np.argsort(inverse, kind="stable")
+    position = np.arange(len(T)) - np.repeat(np.cumsum(counts) - counts, counts)
+    K = np.full((len(maturities), counts.max(initial=0)), np.nan)
+    V = np.full_like(K, np.nan)
+    K[inverse[order], position] = k[order]
+    V[inverse[order], position] = iv[order]
+    return maturities[keep], K[keep], V[keep]
+
+
+def _butterfly_density(k, params):
+    """ Densité g(k) de Gatheral (g >= 0 : pas d'arbitrage papillon) et w(k), par tranche. """
+    a, b, rho, m, sigma = (params[..., i, None] for i in range(5))
+    x = k - m
+    root = np.sqrt(x * x + sigma * sigma)
+    w = a + b * (rho * x + root)
+    w1 = b * (rho + x / root)
+    w2 = b * sigma * sigma / root ** 3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        g = (1 - k * w1 / (2 * w)) ** 2 - w1 ** 2 / 4 * (1 / w + 0.25) + w2 / 2
+    return np.where(w > 0, g, -1.0), w
+
+
+def fit_svi(k, iv, T, warm=None, min_quotes=5, max_iter=50, grid=np.linspace(-1.0, 1.0, 41),
+            penalty=10.0, passes=2):
+    """
+    Une tranche SVI par maturité, toutes ajustées ensemble (erreur en volatilité implicite).
+    k, iv, T : cotations à plat (log-moneyness, iv, maturité en années), toutes utilisées.
+    Départ : SSVI (sans arbitrage) ou, avec warm = (T, params) d'un ajustement précédent,
+    les paramètres de la maturité la plus proche. Les arbitrages papillon (g(k) < 0) et
+    calendaires (variance totale sous celle de la tranche précédente ou au-dessus de la
+    suivante) sur `grid` sont pénalisés ; les bornes calendaires sont mises à jour entre
+    les `passes`. Retourne SVISurface.
+    """
+    k, iv, T = (np.asarray(a, dtype=np.float64) for a in (k, iv, T))
+    maturities, K, V = _padded_slices(k, iv, T, min_quotes)
+    if not len(maturities):
+        raise ValueError(f"aucune maturité avec au moins {min_quotes} cotations")
+    mask = np.isfinite(K)
+    K0, V0 = np.where(mask, K, 0.0), np.where(mask, V, 0.0)
+
+    if warm is not None and len(warm[0]):
+        warm_T, warm_params = warm
+        nearest = np.abs(maturities[:, None] - np.asarray(warm_T)[None, :]).argmin(axis=1)
+        params = np.array(warm_params, dtype=np.float64)[nearest]
+    else:
+        params = fit_ssvi(k, iv, T, min_quotes=min_quotes, max_iter=max_iter).params.copy()
+
+    sqrt_T = np.sqrt(maturities)
+    # tranches paires puis impaires, voisines figées : les bornes calendaires ne bougent pas
+    # pendant un ajustement, et la dernière demi-passe contrôle toutes les paires de tranches
+    for subset in [np.arange(parity, len(maturities), 2) for _ in range(passes) for parity in (0, 1)]:
+        if not len(subset):
+            continue
+        w_grid = svi_total_variance(np.broadcast_to(grid, (len(maturities), len(grid))), params)
+        lower = np.vstack([np.full(len(grid), 0.0), w_grid[:-1]])[subset]
+        upper = np.vstack([w_grid[1:], np.full(len(grid), np.inf)])[subset]
+        K_s, V_s, mask_s, t_s = K0[subset], V0[subset], mask[subset], sqrt_T[subset]
+
+        def residuals(u):
+            # u : (tranches x reps, 5), tranche par tranche (jacobien : reps décalages par tranche)
+            reps = len(u) // len(subset)
+            repeat = lambda a: np.repeat(a, reps, axis=0)
+            candidate = _svi_from_free(u)
+            t = repeat(t_s)[:, None]
+            w = svi_total_variance(repeat(K_s), candidate)
+            fit = np.where(repeat(mask_s), np.sqrt(np.maximum(w, 0.0)) / t - repeat(V_s), 0.0)
+            g, w_arb = _butterfly_density(grid, candidate)
+            vol = np.sqrt(np.maximum(w_arb, 0.0)) / t
+            below = np.sqrt(repeat(lower)) / t - vol
+            above = vol - np.sqrt(repeat(upper)) / t
+            return np.hstack([fit, penalty * np.maximum(-g, 0.0),
+                              penalty * np.maximum(below, 0.0), penalty * np.maximum(above, 0.0)])
+
+        u, _ = levenberg_marquardt(residuals, _svi_to_free(params[subset]), max_iter=max_iter)
+        params[subset] = _svi_from_free(u)
+    return SVISurface(maturities, params)
+
+
+def ssvi_phi(theta, eta, gamma):
+    # fonction de courbure "power law" de Gatheral-Jacquier
+    return eta / (theta ** gamma * (1.0 + theta) ** (1.0 - gamma))
+
+
+def ssvi_to_svi(theta, rho, eta, gamma):
+    """ Tranche SSVI de variance ATM theta -> paramètres SVI raw équivalents. """
+    phi = ssvi_phi(theta, eta, gamma)
+    rho = np.broadcast_to(rho, np.shape(theta))
+    return np.stack([theta / 2 * (1 - rho ** 2), theta * phi / 2, rho, -rho / phi,
+                     np.sqrt(1 - rho ** 2) / phi], axis=-1)
+
+
+def fit_ssvi(k, iv, T, warm=None, min_quotes=5, max_iter=100):
+    """
+    SSVI global : variance ATM theta(T) par tranche (croissante en T, pas d'arbitrage
+    calendaire), puis (rho, eta, gamma) communs à toutes les maturités avec
+    eta (1 + |rho|) <= 2 et gamma dans (0, 1/2] : surface sans arbitrage statique.
+    warm : (rho, eta, gamma) d'un ajustement précédent.
+    """
+    k, iv, T = (np.asarray(a, dtype=np.float64) for a in (k, iv, T))
+    maturities, K, V = _padded_slices(k, iv, T, min_quotes)
+    if not len(maturities):
+        raise ValueError(f"aucune maturité avec au moins {min_quotes} cotations")
+    # theta : variance totale interpolée à k = 0 sur chaque tranche, puis rendue croissante
+    theta = np.empty(len(maturities))
+    for i in range(len(maturities)):
+        ok = np.isfinite(K[i])
+        order = np.argsort(K[i, ok])
+        theta[i] = np.interp(0.0, K[i, ok][order], V[i, ok][order]) ** 2 * maturities[i]
+    theta = np.maximum.accumulate(theta)
+
+    mask = np.isfinite(K)
+    k_flat, iv_flat = K[mask], V[mask]
+    theta_flat = np.broadcast_to(theta[:, None], K.shape)[mask]
+    T_flat = np.broadcast_to(maturities[:, None], K.shape)[mask]
+
+    def from_free(u):
+        rho = RHO_MAX * np.tanh(u[:, 0])
+        eta = 2.0 / (1.0 + np.abs(rho)) * _sigmoid(u[:, 1])
+        gamma = 0.5 * _sigmoid(u[:, 2])
+        return rho, eta, gamma
+
+    def residuals(u):
+        rho, eta, gamma = (p[:, None] for p in from_free(u))
+        phi_k = ssvi_phi(theta_flat[None, :], eta, gamma) * k_flat[None, :]
+        w = theta_flat / 2 * (1 + rho * phi_k + np.sqrt((phi_k + rho) ** 2 + 1 - rho ** 2))
+        return np.sqrt(np.maximum(w, 0.0) / T_flat) - iv_flat
+
+    if warm is not None:
+        rho, eta, gamma = warm
+        rho = np.clip(rho, -RHO_MAX + 1e-9, RHO_MAX - 1e-9)
+        scaled = np.clip(eta * (1 + abs(rho)) / 2, 1e-9, 1 - 1e-9)
+        g = np.clip(2 * gamma, 1e-9, 1 - 1e-9)
+        u0 = [np.arctanh(rho / RHO_MAX), np.log(scaled / (1 - scaled)), np.log(g / (1 - g))]
+    else:
+        u0 = [np.arctanh(-0.5 / RHO_MAX), 0.0, 0.0]
+    u, _ = levenberg_marquardt(residuals, np.array([u0]), max_iter=max_iter)
+    rho, eta, gamma = (float(p[0]) for p in from_free(u))
+    surface = SVISurface(maturities, ssvi_to_svi(theta, rho, eta, gamma))
+    surface.ssvi = (rho, eta, gamma)
+    return surface
+
+
+class SVISurface:
+    """
+    Surface paramétrique : tranches SVI raw aux maturités T (années). Entre deux tranches
+    la variance totale est interpolée linéairement en T à k fixé (l'ordre des tranches,
+    donc l'absence d'arbitrage calendaire, est conservé) ; en dehors, la vol implicite
+    de la tranche la plus proche est prolongée.
+    """
+
+    def __init__(self, T, params):
+        self.T = np.asarray(T, dtype=np.float64)
+        self.params = np.asarray(params, dtype=np.float64)
+        self.ssvi = None
+
+    def total_variance(self, k, T):
+        k, T = np.broadcast_arrays(np.asarray(k, dtype=np.float64), np.asarray(T, dtype=np.float64))
+        slices = svi_total_variance(np.broadcast_to(k.ravel(), (len(self.T), k.size)), self.params)
+        j = np.clip(np.searchsorted(self.T, T.ravel()) - 1, 0, max(len(self.T) - 2, 0))
+        cols = np.arange(k.size)
+        if len(self.T) == 1:
+            return (slices[0] * T.ravel() / self.T[0]).reshape(k.shape)
+        lo, hi = self.T[j], self.T[j + 1]
+        t = np.clip(T.ravel(), self.T[0], self.T[-1])
+        w = slices[j, cols] + (slices[j + 1, cols] - slices[j, cols]) * (t - lo) / (hi - lo)
+        # extrapolation à vol implicite constante
+        return (w * T.ravel() / t).reshape(k.shape)
+
+    def implied_vol(self, k, T):
+        T = np.asarray(T, dtype=np.float64)
+        return np.sqrt(np.maximum(self.total_variance(k, T), 0.0) / T)
+
+    def butterfly_violations(self, k=np.linspace(-1.0, 1.0, 201), tol=1e-8):
+        """ Nombre de points de `k` où la densité g(k) de Gatheral est négative, par maturité. """
+        g, _ = _butterfly_density(k, self.params)
+        return (g < -tol).sum(axis=1)
+
+    def calendar_violations(self, k=np.linspace(-1.0, 1.0, 201), tol=1e-8):
+        # variance totale décroissante entre deux maturités successives, à k fixé
+        w = svi_total_variance(np.broadcast_to(k, (len(self.T), len(k))), self.params)
+        return (np.diff(w, axis=0) < -tol).sum(axis=1)
@@ -0,0 +1,52 @@
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from utils.config_loader import load_yaml, save_yaml
+from utils.data_handler import invalidate_data_handlers
+from strategies import buy_and_hold
+from strategies.buy_and_hold import BuyAndHold
+
+ROOT = __file__.rsplit("/tests/", 1)[0]
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # configs du dépôt + prix synthétiques dans data/etf.pkl
+    shutil.copytree(f"{ROOT}/config", tmp_path / "config")
+    general = load_yaml(str(tmp_path / "config/general.yaml"))
+    save_yaml({**general, "start_date": "2020-01-01", "end_date": "2020-12-31"}, str(tmp_path / "config/general.yaml"))
+    dates = pd.bdate_range("2020-01-01", "2020-12-31")
+    rng = np.random.default_rng(0)
+    prices = {}
+    for symbol in ["SPY", "QQQ"]:
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+        for field in ["Open", "High", "Low", "Close", "Adj Close"]:
+            prices[(symbol, field)] = close
+        prices[(symbol, "Volume")] = np.full(len(dates), 1e6)
+    (tmp_path / "data").mkdir()
+    pd.DataFrame(prices, index=dates).to_pickle(tmp_path / "data/etf.pkl")
+    monkeypatch.chdir(tmp_path)
+    buy_and_hold._benchmark_cache.clear()
+    invalidate_data_handlers()
+    yield tmp_path
+    buy_and_hold._benchmark_cache.clear()
+    invalidate_data_handlers()
+
+
+def test_benchmark_follows_capital(workdir):
+    before, _ = BuyAndHold("QQQ").cached_benchmark("SPY")
+    general = load_yaml("config/general.yaml")
+    save_yaml({**general, "capital": general["capital"] * 2}, "config/general.yaml")
+    after, _ = BuyAndHold("QQQ").cached_benchmark("SPY")
+    np.testing.assert_allclose(after["value"].iloc[-1], 2 * before["value"].iloc[-1], rtol=1e-6)
+
+
+def test_benchmark_uses_params_override(workdir):
+    default, _ = BuyAndHold("QQQ").cached_benchmark("SPY")
+    params = {"reallocation_amount": 500.0, "reallocation_window": 21}
+    strategy = BuyAndHold("QQQ", params=params)
+    overridden, _ = strategy.cached_benchmark("SPY")
+    expected, _ = BuyAndHold("SPY", params=params, save_outputs=False).run_benchmark("SPY")
+    assert overridden["value"].iloc[-1] > default["value"].iloc[-1]
+    pd.testing.assert_frame_equal(overridden, expected)
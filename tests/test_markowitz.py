@@ -0,0 +1,39 @@
+import cvxpy as cp
+import numpy as np
+from strategies.markowitz import FrontierSolver
+
+
+def singular_covariance():
+    # actifs 0 et 1 colinéaires, actif 2 à prix constant (variance nulle)
+    rng = np.random.default_rng(0)
+    base = rng.normal(0, 0.01, (250, 2))
+    returns = np.column_stack([base[:, 0], 2 * base[:, 0], np.zeros(250), base[:, 1]])
+    cov = np.cov(returns, rowvar=False)
+    assert np.linalg.matrix_rank(cov) < len(cov)
+    return cov
+
+
+def test_set_moments_accepts_singular_covariance():
+    cov = singular_covariance()
+    solver = FrontierSolver(len(cov), diversification=0.3)
+    solver.set_moments(cov)
+    np.testing.assert_allclose(solver.chol.value @ solver.chol.value.T, cov, atol=1e-12)
+
+
+def test_frontier_on_singular_covariance_matches_quad_form():
+    cov = singular_covariance()
+    mu = np.array([0.0004, 0.0008, 0.0001, 0.0005])
+    solver = FrontierSolver(len(cov), diversification=0.3)
+    solver.set_moments(cov)
+    w = solver.solve(2.0, mu)
+    assert w is not None
+    np.testing.assert_allclose(w.sum(), 1, atol=1e-6)
+
+    # même problème écrit avec la covariance (formulation d'avant le facteur de Cholesky)
+    ref = cp.Variable(len(cov))
+    objective = cp.quad_form(ref, cp.psd_wrap(cov)) - 2.0 * mu @ ref
+    cp.Problem(cp.Minimize(objective), [cp.sum(ref) == 1, ref >= 0,
+                                        len(cov) * cp.sum_squares(ref) <= 1 / 0.3]).solve()
+    value = lambda x: x @ cov @ x - 2.0 * mu @ x
+    np.testing.assert_allclose(value(w), value(ref.value), atol=1e-7)
+    assert solver.max_sharpe(mu, 0.0) is not None
@@ -111,3 +111,19 @@ def create_pairs_trading_tab(app):
             lbl_bench.set(stat, v_bench)
 
     ttk.Button(frame, text="Lancer le backtest", command=launch).pack(pady=8)
+
+    # ======================================================
+    # Bouton : Scanner l'univers (pré-filtre + backtests en parallèle)
+    # ======================================================
+    def scan():
+        from strategies.pairs_scanner import PairsScanner
+        importlib.reload(config)
+
+        table = PairsScanner().run_scan()
+        if table.empty:
+            messagebox.showinfo("Scan", "Aucune paire ne passe le pré-filtre.")
+            return
+        # la meilleure paire (Sharpe) devient la paire courante
+        pair_var.set(table.index[0])
+
+    ttk.Button(frame, text="Scanner l'univers", command=scan).pack(pady=3)
@@ -1,11 +1,62 @@
 import yfinance as yf
 import pandas as pd
 import os
+from utils.price_store import PriceStore, META_FILE
+
+# Un seul DataHandler par fichier pour tout le process (stratégies, benchmarks, UI)
+_registry = {}
+
+
+def get_data_handler(data_path: str) -> "DataHandler":
+    key = os.path.abspath(data_path)
+    handler = _registry.get(key)
+    if handler is None or handler.is_stale():
+        handler = DataHandler(data_path)
+        _registry[key] = handler
+    return handler
+
+
+def register_data_handler(data_path: str, handler: "DataHandler"):
+    # ex: un worker de sweep rattaché à un store en mémoire partagée
+    _registry[os.path.abspath(data_path)] = handler
+
+
+def invalidate_data_handlers(data_path: str = None):
+    if data_path is None:
+        _registry.clear()
+    else:
+        _registry.pop(os.path.abspath(data_path), None)
+
 
 class DataHandler:
     def __init__(self, data_path: str = None):
         self.data_path = data_path
         self._data_cache = None
+        # data/etf.pkl -> data/etf/ (voir utils.price_store.convert_pickle_to_store)
+        store_path = os.path.splitext(data_path)[0] if data_path else None
+        self.store = PriceStore(store_path) if store_path and PriceStore.exists(store_path) else None
+        self.mtime = self.source_mtime()
+
+    @classmethod
+    def from_store(cls, store):
+        handler = cls(data_path=None)
+        handler.store = store
+        return handler
+
+    def source_mtime(self):
+        if self.store is not None:
+            if self.store.root is None:
+                return None  # store en mémoire partagée : pas de fichier source
+            return os.path.getmtime(os.path.join(self.store.root, META_FILE))
+        if self.data_path and os.path.exists(self.data_path):
+            return os.path.getmtime(self.data_path)
+        return None
+
+    def is_stale(self):
+        store_path = os.path.splitext(self.data_path)[0] if self.data_path else None
+        if self.store is None and store_path and PriceStore.exists(store_path):
+            return True  # un store a été converti depuis le chargement
+        return self.source_mtime() != self.mtime
 
     def load_data(self):
         if self._data_cache is None:
@@ -15,6 +66,8 @@ class DataHandler:
         return self._data_cache
 
     def get(self, symbol: str, price = None, start: str = None, end: str = None) -> pd.DataFrame:
+        if self.store is not None:
+            return self._get_from_store(symbol, price, start, end)
         if price == None:
             df = self.load_data()[symbol]
         else:
@@ -23,10 +76,20 @@ class DataHandler:
             df = df.loc[start:end]
         return df
 
+    def _get_from_store(self, symbol, price, start, end):
+        if not isinstance(symbol, str):
+            frames = {s: self.store.frame(s, None if price is None else _as_list(price), start, end) for s in symbol}
+            return pd.concat(frames, axis=1, names=["Ticker", "Price"])
+        if price is None or not isinstance(price, str):
+            return self.store.frame(symbol, None if price is None else list(price), start, end)
+        return self.store.series(symbol, price, start, end)
+
     def get_multiple(self, symbols: list, price = ['Open', 'High', 'Low', 'Close', 'Volume'], start: str = None, end: str = None) -> dict:
         return {s: self.get(s, price, start, end) for s in symbols}
     
     def get_multiple_df(self, symbols: list, price, start: str = None, end: str = None) -> pd.DataFrame:
+        if self.store is not None:
+            return self.store.matrix(symbols, price, start, end)
         data = self.load_data()
         adj_close_df = data.loc[start:end, pd.IndexSlice[symbols, price]]
         adj_close_df.columns = adj_close_df.columns.droplevel(1)
@@ -59,3 +122,6 @@ class DataHandler:
         df.to_pickle('etf.pkl')
         return df
 
+
+def _as_list(price):
+    return [price] if isinstance(price, str) else list(price)
@@ -1,8 +1,11 @@
 import os
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.chart import LineChart, Reference
+from openpyxl.utils import get_column_letter
 from openpyxl.utils.dataframe import dataframe_to_rows
 
 def auto_adjust_column_width(ws):
@@ -24,7 +27,11 @@ def export_backtest_to_excel(
         weights_df: pd.DataFrame,
         ohlc_data: dict,
         trades_df: pd.DataFrame,
-        frontier_df: pd.DataFrame = None
+        frontier_df: pd.DataFrame = None,
+        streaming: bool = True,
+        sidecar_rows: int = None,
+        sidecar_format: str = "parquet",
+        chunk_size: int = 10000
     ):
     """
     Créé un export Excel professionnel avec :
@@ -34,7 +41,22 @@ def export_backtest_to_excel(
     - OHLC pour chaque actif
     - Trade log
     - Frontier Markowitz (optionnel)
+
+    streaming : classeur write-only écrit au fil de l'eau (largeurs de colonnes calculées
+    sur un échantillon, OHLC écrits par blocs de `chunk_size` lignes). False : ancien
+    classeur en mémoire.
+    sidecar_rows : au-delà de ce nombre de lignes, une feuille est écrite à côté du
+    classeur (Parquet, ou CSV si pyarrow est absent) et la feuille Excel pointe vers le fichier.
     """
+    args = (filepath, summary_stats, equity_df, weights_df, ohlc_data, trades_df, frontier_df)
+    if not streaming:
+        _export_in_memory(*args)
+    else:
+        _export_streaming(*args, sidecar_rows=sidecar_rows, sidecar_format=sidecar_format, chunk_size=chunk_size)
+    print(f"✔ Excel exporté : {filepath}")
+
+
+def _export_in_memory(filepath, summary_stats, equity_df, weights_df, ohlc_data, trades_df, frontier_df=None):
     wb = Workbook()
 
     # ============================================================
@@ -101,15 +123,16 @@ def export_backtest_to_excel(
 
     auto_adjust_column_width(ws)
 
-    # # ============================================================
-    # # 📌 ONGLET 4 : TRADES
-    # # ============================================================
-    # ws = wb.create_sheet("Trades")
+    # ============================================================
+    # 📌 ONGLET 4 : TRADES
+    # ============================================================
+    if trades_df is not None:
+        ws = wb.create_sheet("Trades")
 
-    # for r in dataframe_to_rows(trades_df, index=False, header=True):
-    #     ws.append(r)
+        for r in dataframe_to_rows(trades_df, index=False, header=True):
+            ws.append(r)
 
-    # auto_adjust_column_width(ws)
+        auto_adjust_column_width(ws)
 
     # ============================================================
     # 📌 ONGLET 5 : Frontier (Markowitz)
@@ -134,4 +157,118 @@ def export_backtest_to_excel(
     # ============================================================
     os.makedirs(os.path.dirname(filepath), exist_ok=True)
     wb.save(filepath)
-    print(f"✔ Excel exporté : {filepath}")
+
+
+def column_widths(df, index=True, sample=1000):
+    """
+    Largeurs de colonnes (comme auto_adjust_column_width) calculées sur les en-têtes et
+    un échantillon régulier d'au plus `sample` lignes, sans relire les cellules.
+    """
+    positions = np.unique(np.linspace(0, len(df) - 1, min(len(df), sample)).astype(int)) if len(df) else []
+    rows = df.iloc[positions]
+    header = list(dataframe_to_rows(df.iloc[:0], index=index, header=True))
+    widths = []
+    if index:
+        values = [str(v) for v in rows.index.tolist()] + [str(v) for r in header for v in r[:df.index.nlevels]]
+        widths.append(max(map(len, values)))
+    for j in range(df.shape[1]):
+        values = [str(v) for v in rows.iloc[:, j].tolist()]
+        values += [str(r[j + df.index.nlevels if index else j]) for r in header if len(r) > df.index.nlevels]
+        widths.append(max(map(len, values)) if values else 0)
+    return [w + 2 for w in widths]
+
+
+def _write_frame(ws, df, index=True, chunk_size=10000):
+    # largeurs fixées avant la 1re ligne (obligatoire en write-only)
+    for j, width in enumerate(column_widths(df, index=index), start=1):
+        ws.column_dimensions[get_column_letter(j)].width = width
+    for r in dataframe_to_rows(df.iloc[:0], index=index, header=True):
+        ws.append(r)
+    # données écrites par blocs depuis les tableaux de colonnes
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        columns = [chunk.iloc[:, j].tolist() for j in range(chunk.shape[1])]
+        if index:
+            labels = [list(v) if isinstance(v, tuple) else [v] for v in chunk.index.tolist()]
+            for label, *values in zip(labels, *columns):
+                ws.append(label + values)
+        else:
+            for values in zip(*columns):
+                ws.append(list(values))
+
+
+def _write_sidecar(filepath, sheet, df, fmt):
+    base = os.path.splitext(filepath)[0]
+    if fmt == "parquet":
+        path = f"{base}_{sheet}.parquet"
+        try:
+            df.to_parquet(path)
+            return path
+        except (ImportError, ValueError, TypeError):
+            pass  # pas de moteur parquet ou colonnes non supportées : CSV
+    path = f"{base}_{sheet}.csv"
+    df.to_csv(path)
+    return path
+
+
+def _write_sheet(wb, filepath, sheet, df, index=True, sidecar_rows=None, sidecar_format="parquet", chunk_size=10000):
+    ws = wb.create_sheet(sheet)
+    if sidecar_rows is not None and len(df) > sidecar_rows:
+        path = _write_sidecar(filepath, sheet, df, sidecar_format)
+        ws.column_dimensions["A"].width = 20
+        ws.append(["Données complètes", os.path.basename(path)])
+        ws.append(["Lignes", len(df)])
+        return ws, False
+    _write_frame(ws, df, index=index, chunk_size=chunk_size)
+    return ws, True
+
+
+def _export_streaming(filepath, summary_stats, equity_df, weights_df, ohlc_data, trades_df, frontier_df=None,
+                      sidecar_rows=None, sidecar_format="parquet", chunk_size=10000):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    wb = Workbook(write_only=True)
+    sheet_args = dict(sidecar_rows=sidecar_rows, sidecar_format=sidecar_format, chunk_size=chunk_size)
+
+    # Summary : mêmes styles que le classeur en mémoire, posés cellule par cellule à l'écriture
+    ws = wb.create_sheet("Summary")
+    rows = [["Metric", "Portfolio", "Benchmark", "Diff"]]
+    for metric in summary_stats.index:
+        port = summary_stats.loc[metric]["Portefeuille"]
+        bench = summary_stats.loc[metric]["Benchmark"]
+        diff = None if (port is None or bench is None) else port - bench
+        rows.append([metric, port, bench, diff])
+    for j in range(4):
+        ws.column_dimensions[get_column_letter(j + 1)].width = max(len(str(r[j])) for r in rows) + 2
+    for i, row in enumerate(rows):
+        cells = []
+        for j, value in enumerate(row):
+            cell = WriteOnlyCell(ws, value=value)
+            if i == 0 or j == 0:
+                cell.font = Font(bold=True)
+            elif isinstance(value, (int, float)) and value > 0:
+                cell.font = Font(color="008000", bold=True)
+            elif isinstance(value, (int, float)) and value < 0:
+                cell.font = Font(color="B00000", bold=True)
+            cells.append(cell)
+        ws.append(cells)
+
+    ws, in_sheet = _write_sheet(wb, filepath, "Portfolio_Equity", equity_df, **sheet_args)
+    if in_sheet:
+        chart = LineChart()
+        chart.title = "Portfolio vs Benchmark"
+        chart.y_axis.title = "Value ($)"
+        data = Reference(ws, min_col=2, max_col=3, min_row=1, max_row=len(equity_df) + 1)
+        chart.add_data(data, titles_from_data=True)
+        dates = Reference(ws, min_col=1, min_row=2, max_row=len(equity_df) + 1)
+        chart.set_categories(dates)
+        ws.add_chart(chart, "E2")
+
+    _write_sheet(wb, filepath, "Weights", weights_df, **sheet_args)
+    if trades_df is not None:
+        _write_sheet(wb, filepath, "Trades", trades_df, index=False, **sheet_args)
+    if frontier_df is not None:
+        _write_sheet(wb, filepath, "Frontier", frontier_df, index=False, **sheet_args)
+    for sym, df_asset in ohlc_data.items():
+        _write_sheet(wb, filepath, sym, df_asset, **sheet_args)
+
+    wb.save(filepath)
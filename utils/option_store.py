@@ -0,0 +1,141 @@
+import os
+import glob
+import uuid
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+GREEKS = ["iv", "delta", "gamma", "theta", "vega", "rho"]
+
+
+def normalize_chain(df):
+    """
+    Types de colonnes du store : dates parsées (les CSV historiques mélangent
+    'AAAA-MM-JJ' et 'AAAA-MM-JJ HH:MM:SS'), type catégoriel, grecques en float32.
+    """
+    df = df.copy()
+    df["date"] = pd.to_datetime(df["date"], format="ISO8601").dt.normalize()
+    df["expiration"] = pd.to_datetime(df["expiration"], format="ISO8601")
+    if "last_trade_time" in df.columns:
+        df["last_trade_time"] = pd.to_datetime(df["last_trade_time"], format="ISO8601", errors="coerce")
+    df["option_symbol"] = df["option_symbol"].astype(str)
+    df["type"] = pd.Categorical(df["type"], categories=["C", "P"])
+    for col in GREEKS:
+        if col in df.columns:
+            df[col] = df[col].astype(np.float32)
+    return df
+
+
+class OptionStore:
+    """
+    Historique des chaînes d'options en Parquet, partitionné par ticker et par date :
+
+        market_data/options/ticker=NVDA/date=2025-12-12/part-<id>.parquet
+
+    Un ajout n'écrit que les nouvelles lignes (dédoublonnées sur (date, option_symbol)
+    contre la seule partition du jour) ; une lecture ne parcourt que les partitions
+    demandées et filtre expiration / strike sur les statistiques des fichiers.
+    """
+
+    def __init__(self, root="market_data/options"):
+        self.root = root
+        self.partitioning = ds.partitioning(
+            pa.schema([("ticker", pa.string()), ("date", pa.string())]), flavor="hive"
+        )
+
+    def _partition(self, ticker, date):
+        return os.path.join(self.root, f"ticker={ticker}", f"date={pd.Timestamp(date):%Y-%m-%d}")
+
+    def exists(self, ticker):
+        return os.path.isdir(os.path.join(self.root, f"ticker={ticker}"))
+
+    def tickers(self):
+        return sorted(d.split("=", 1)[1] for d in os.listdir(self.root) if d.startswith("ticker=")) \
+            if os.path.isdir(self.root) else []
+
+    def dates(self, ticker):
+        paths = glob.glob(os.path.join(self.root, f"ticker={ticker}", "date=*"))
+        return sorted(pd.Timestamp(os.path.basename(p).split("=", 1)[1]) for p in paths)
+
+    def append(self, ticker, df):
+        """ Ajoute les lignes absentes du store, retourne le nombre de lignes écrites. """
+        df = normalize_chain(df).drop_duplicates(subset=["date", "option_symbol"])
+        written = 0
+        for date, day in df.groupby("date", sort=True):
+            path = self._partition(ticker, date)
+            files = glob.glob(os.path.join(path, "*.parquet"))
+            if files:
+                known = pq.read_table(files, columns=["option_symbol"]).column("option_symbol").to_pylist()
+                day = day[~day["option_symbol"].isin(set(known))]
+            if day.empty:
+                continue
+            os.makedirs(path, exist_ok=True)
+            # tri par échéance / strike : statistiques de fichier exploitables par les filtres
+            day = day.drop(columns=["date"]).sort_values(["expiration", "strike"])
+            day.to_parquet(os.path.join(path, f"part-{uuid.uuid4().hex}.parquet"), index=False)
+            written += len(day)
+        return written
+
+    def dataset(self, ticker=None):
+        root = self.root if ticker is None else os.path.join(self.root, f"ticker={ticker}")
+        partitioning = self.partitioning if ticker is None else ds.partitioning(
+            pa.schema([("date", pa.string())]), flavor="hive"
+        )
+        return ds.dataset(root, format="parquet", partitioning=partitioning)
+
+    def read(self, ticker, date=None, start=None, end=None, expiration=None, strike=None, columns=None):
+        """
+        Lignes d'un ticker. date : un jour ; start / end : bornes incluses ;
+        expiration, strike : (min, max) inclus, None pour ne pas filtrer.
+        """
+        if not self.exists(ticker):
+            raise KeyError(f"{ticker} absent du store {self.root} (migration des CSV : python -m utils.option_store)")
+        day = lambda d: f"{pd.Timestamp(d):%Y-%m-%d}"
+        conditions = []
+        if date is not None:
+            conditions.append(ds.field("date") == day(date))
+        if start is not None:
+            conditions.append(ds.field("date") >= day(start))
+        if end is not None:
+            conditions.append(ds.field("date") <= day(end))
+        if expiration is not None:
+            lo, hi = expiration
+            conditions.append(ds.field("expiration") >= pd.Timestamp(lo))
+            conditions.append(ds.field("expiration") <= pd.Timestamp(hi))
+        if strike is not None:
+            lo, hi = strike
+            conditions.append((ds.field("strike") >= lo) & (ds.field("strike") <= hi))
+        condition = None
+        for c in conditions:
+            condition = c if condition is None else condition & c
+
+        if columns is not None and "date" not in columns:
+            columns = ["date"] + list(columns)
+        table = self.dataset(ticker).to_table(columns=columns, filter=condition)
+        df = table.to_pandas()
+        df.insert(0, "date", pd.to_datetime(df.pop("date")))
+        if "type" in df.columns:
+            df["type"] = pd.Categorical(df["type"], categories=["C", "P"])
+        order = [c for c in ["date", "option_symbol", "expiration", "strike"] if c in df.columns]
+        return df.sort_values(order).reset_index(drop=True)
+
+    def count(self, ticker):
+        return self.dataset(ticker).count_rows() if self.exists(ticker) else 0
+
+
+def import_csv_history(root="market_data/options", pattern="market_data/*.csv"):
+    # migration des CSV historiques (un fichier par ticker) vers le store
+    store = OptionStore(root)
+    for path in sorted(glob.glob(pattern)):
+        ticker = os.path.splitext(os.path.basename(path))[0]
+        df = pd.read_csv(path)
+        if "option_symbol" not in df.columns:
+            continue  # ex: riskfree.csv
+        print(f"{ticker}: {store.append(ticker, df)} lignes importées")
+    return store
+
+
+if __name__ == "__main__":
+    import_csv_history()
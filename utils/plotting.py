@@ -0,0 +1,55 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+def lttb_indices(y, n_out):
+    """
+    Largest-Triangle-Three-Buckets : indices de `n_out` points de y qui conservent la
+    forme de la courbe (pics et creux), à appliquer à toutes les séries d'un même axe x.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64)
+    # n_out - 2 seaux entre le premier et le dernier point, qui sont toujours gardés
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    out = np.empty(n_out, dtype=int)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:next_hi].mean()
+        avg_y = y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def resample_ohlc(ohlc, max_points):
+    # chandeliers hebdomadaires puis mensuels tant que l'historique dépasse max_points
+    if len(ohlc) <= max_points:
+        return ohlc
+    how = {'Open': 'first', 'High': 'max', 'Low': 'min', 'Close': 'last', 'Volume': 'sum'}
+    how = {col: agg for col, agg in how.items() if col in ohlc.columns}
+    for rule in ("W", "ME"):
+        resampled = ohlc.resample(rule).agg(how).dropna(subset=['Close'])
+        if len(resampled) <= max_points:
+            break
+    return resampled
+
+
+def figure_key(*parts):
+    """ Empreinte d'un run (DataFrames / Series / objets repr-ables) pour le cache des figures. """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            digest.update(pd.util.hash_pandas_object(part).to_numpy().tobytes())
+            labels = part.columns if isinstance(part, pd.DataFrame) else [part.name]
+            digest.update(repr(list(labels)).encode())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
@@ -0,0 +1,176 @@
+import json
+import os
+import sys
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+META_FILE = "meta.json"
+DATES_FILE = "dates.npy"
+
+
+class PriceStore:
+    """
+    Stockage colonnaire des prix : un tableau float64 par (symbole, champ)
+    et un index de dates partagé. Les lectures sont memory-mappées.
+
+    Layout :
+        <root>/meta.json              {"symbols": {sym: [fields]}}
+        <root>/dates.npy              datetime64
+        <root>/<sym>/<field>.npy      float64
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        if not self.exists(root):
+            raise FileNotFoundError(f"Store non trouvé : {root}")
+        with open(os.path.join(root, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.fields = meta["symbols"]
+        self.index = pd.DatetimeIndex(np.load(os.path.join(root, DATES_FILE)))
+        self._arrays = {}
+
+    @staticmethod
+    def exists(root: str) -> bool:
+        return os.path.isfile(os.path.join(root, META_FILE))
+
+    @property
+    def symbols(self):
+        return list(self.fields)
+
+    def _path(self, symbol, field):
+        return os.path.join(self.root, _safe_name(symbol), f"{_safe_name(field)}.npy")
+
+    def array(self, symbol: str, field: str) -> np.ndarray:
+        key = (symbol, field)
+        if key not in self._arrays:
+            if symbol not in self.fields or field not in self.fields[symbol]:
+                raise KeyError(key)
+            self._arrays[key] = np.load(self._path(symbol, field), mmap_mode="r")
+        return self._arrays[key]
+
+    def bounds(self, start=None, end=None):
+        # mêmes bornes inclusives que df.loc[start:end]
+        lo = 0 if start is None else self.index.searchsorted(pd.Timestamp(start), side="left")
+        hi = len(self.index) if end is None else self.index.searchsorted(pd.Timestamp(end), side="right")
+        return lo, hi
+
+    def series(self, symbol, field, start=None, end=None) -> pd.Series:
+        lo, hi = self.bounds(start, end)
+        return pd.Series(self.array(symbol, field)[lo:hi], index=self.index[lo:hi], name=field, copy=False)
+
+    def frame(self, symbol, fields=None, start=None, end=None) -> pd.DataFrame:
+        if fields is None:
+            fields = self.fields[symbol]
+        lo, hi = self.bounds(start, end)
+        columns = {f: self.array(symbol, f)[lo:hi] for f in fields}
+        df = pd.DataFrame(columns, index=self.index[lo:hi], copy=False)
+        df.columns.name = "Price"
+        return df
+
+    def matrix(self, symbols, field, start=None, end=None) -> pd.DataFrame:
+        lo, hi = self.bounds(start, end)
+        columns = {s: self.array(s, field)[lo:hi] for s in symbols}
+        return pd.DataFrame(columns, index=self.index[lo:hi], copy=False)
+
+
+class SharedPriceStore(PriceStore):
+    """
+    Même interface que PriceStore, mais les colonnes vivent dans un bloc
+    multiprocessing.shared_memory : les workers d'un pool s'y attachent par nom
+    au lieu de recevoir une copie picklée des prix.
+    """
+
+    def __init__(self, name, index, columns, create=False, values=None):
+        self.root = None
+        self.index = pd.DatetimeIndex(index)
+        self.columns = columns  # [(symbole, champ)] dans l'ordre des lignes du bloc
+        shape = (len(columns), len(self.index))
+        if create:
+            self.shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        else:
+            self.shm = _attach_shared_memory(name)
+        self.block = np.ndarray(shape, dtype=np.float64, buffer=self.shm.buf)
+        if values is not None:
+            self.block[:] = values
+        self.fields = {}
+        self._arrays = {}
+        for row, (symbol, field) in enumerate(columns):
+            self.fields.setdefault(symbol, []).append(field)
+            self._arrays[(symbol, field)] = self.block[row]
+
+    @classmethod
+    def from_handler(cls, data_handler, symbols, fields, start=None, end=None):
+        # copie (une seule fois) les colonnes demandées dans un nouveau bloc partagé
+        columns, values = [], []
+        index = None
+        for symbol in symbols:
+            available = data_handler.get(symbol, start=start, end=end)
+            index = available.index if index is None else index
+            for field in fields:
+                if field in available.columns:
+                    columns.append((symbol, field))
+                    values.append(available[field].to_numpy(dtype=np.float64))
+        return cls(None, index, columns, create=True, values=np.array(values).reshape(len(columns), len(index)))
+
+    def spec(self):
+        # de quoi se rattacher au bloc depuis un autre process
+        return self.shm.name, self.index.values, self.columns
+
+    def array(self, symbol: str, field: str) -> np.ndarray:
+        return self._arrays[(symbol, field)]
+
+    def close(self, unlink=False):
+        self._arrays = {}
+        self.block = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _attach_shared_memory(name):
+    # le process créateur gère la durée de vie du bloc (unlink) ; avant 3.13 les workers
+    # partagent son resource_tracker, l'enregistrement en double y est sans effet
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def _safe_name(name: str) -> str:
+    # certains tickers contiennent des caractères interdits dans un nom de fichier
+    return str(name).replace("/", "_").replace("\\", "_")
+
+
+def convert_pickle_to_store(pkl_path: str, root: str = None) -> str:
+    """
+    Convertit un pickle MultiIndex (Ticker, Price) en store colonnaire.
+    Par défaut le store est écrit à côté du pickle : data/etf.pkl -> data/etf/
+    """
+    if root is None:
+        root = os.path.splitext(pkl_path)[0]
+    data = pd.read_pickle(pkl_path).sort_index()
+    os.makedirs(root, exist_ok=True)
+    np.save(os.path.join(root, DATES_FILE), pd.DatetimeIndex(data.index).values)
+
+    fields = {}
+    for symbol in data.columns.get_level_values(0).unique():
+        sym_dir = os.path.join(root, _safe_name(symbol))
+        os.makedirs(sym_dir, exist_ok=True)
+        fields[symbol] = []
+        for field in data[symbol].columns:
+            values = data[symbol][field].to_numpy(dtype=np.float64, na_value=np.nan)
+            np.save(os.path.join(sym_dir, f"{_safe_name(field)}.npy"), values)
+            fields[symbol].append(field)
+
+    # meta en dernier : un store sans meta.json est considéré comme absent
+    with open(os.path.join(root, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"symbols": fields}, f)
+    print(f"✔ Store écrit : {root} ({len(fields)} symboles, {len(data)} dates)")
+    return root
+
+
+if __name__ == "__main__":
+    # python -m utils.price_store data/etf.pkl data/s&p500.pkl
+    for path in sys.argv[1:] or ["data/etf.pkl", "data/s&p500.pkl"]:
+        convert_pickle_to_store(path)
@@ -0,0 +1,90 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def rolling_ols(x, y, window):
+    """
+    Régression y = alpha + beta * x sur toutes les fenêtres glissantes de `window` points
+    en une passe : les fenêtres sont des vues par strides, mais les moments centrés
+    allouent des temporaires (len(x) - window + 1, window).
+    Retourne alpha et beta de longueur len(x) - window + 1 ; l'élément i correspond à la
+    fenêtre qui se termine en x[i + window - 1].
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) < window:
+        return np.empty(0), np.empty(0)
+    xw = sliding_window_view(x, window)
+    yw = sliding_window_view(y, window)
+    x_mean = xw.mean(axis=1)
+    y_mean = yw.mean(axis=1)
+    # moments centrés : pas de perte de précision comme avec sum(x*y) - sum(x)*sum(y)/n
+    x_c = xw - x_mean[:, None]
+    sxx = np.einsum("ij,ij->i", x_c, x_c)
+    sxy = np.einsum("ij,ij->i", x_c, yw - y_mean[:, None])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        beta = sxy / sxx
+    alpha = y_mean - beta * x_mean
+    return alpha, beta
+
+
+class RollingMoments:
+    """
+    Moments d'une fenêtre glissante d'observations (lignes = dates, colonnes = actifs)
+    tenus à jour par ajout / retrait de lignes : somme, produits croisés et termes
+    d'ordre 4 suffisent pour la moyenne, la covariance empirique et le coefficient de
+    shrinkage de Ledoit-Wolf (mêmes formules que sklearn.covariance.LedoitWolf).
+    Les lignes contenant un NaN sont ignorées, comme un dropna() sur la fenêtre.
+    """
+
+    def __init__(self, n_features):
+        self.p = n_features
+        self.n = 0
+        self.s1 = np.zeros(n_features)                   # somme des x
+        self.s2 = np.zeros((n_features, n_features))     # somme des x x'
+        self.a = 0.0                                     # somme des ||x||^2
+        self.a2 = 0.0                                    # somme des ||x||^4
+        self.ax = np.zeros(n_features)                   # somme des ||x||^2 x
+
+    def add(self, rows, sign=1):
+        rows = np.atleast_2d(np.asarray(rows, dtype=np.float64))
+        rows = rows[~np.isnan(rows).any(axis=1)]
+        sq = np.einsum("ij,ij->i", rows, rows)
+        self.n += sign * len(rows)
+        self.s1 += sign * rows.sum(axis=0)
+        self.s2 += sign * (rows.T @ rows)
+        self.a += sign * sq.sum()
+        self.a2 += sign * np.dot(sq, sq)
+        self.ax += sign * (sq @ rows)
+
+    def remove(self, rows):
+        self.add(rows, sign=-1)
+
+    def mean(self):
+        return self.s1 / self.n
+
+    def covariance(self):
+        # covariance empirique biaisée (divisée par n), comme sklearn
+        m = self.mean()
+        return self.s2 / self.n - np.outer(m, m)
+
+    def ledoit_wolf(self):
+        """ Retourne (covariance rétrécie vers mu * I, intensité de shrinkage). """
+        n, p = self.n, self.p
+        m = self.mean()
+        emp_cov = self.covariance()
+        if n < 2:
+            return emp_cov, 0.0
+        mu = np.trace(emp_cov) / p
+        delta_ = np.sum(emp_cov ** 2)
+        # somme sur les dates de ||x - m||^4 à partir des sommes brutes
+        s = np.dot(m, m)
+        beta_ = (self.a2 + 4 * m @ self.s2 @ m + n * s ** 2
+                 - 4 * np.dot(m, self.ax) + 2 * s * self.a - 4 * s * np.dot(m, self.s1))
+        beta = (beta_ / n - delta_) / (p * n)
+        delta = (delta_ - 2 * mu * np.trace(emp_cov) + p * mu ** 2) / p
+        beta = min(beta, delta)
+        shrinkage = 0.0 if beta == 0 else beta / delta
+        shrunk = (1 - shrinkage) * emp_cov
+        shrunk.flat[::p + 1] += shrinkage * mu
+        return shrunk, shrinkage
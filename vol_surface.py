@@ -5,20 +5,33 @@ import numpy as np
 from collections import defaultdict
 import seaborn as sns
 import scipy.interpolate as interpolate
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from utils.option_store import OptionStore
+from utils.config_loader import load_yaml
+from strategies.iv_crush.option_pricing import norm_cdf
+import svi
 
 
 
-def get_data(ticker, date):
-    OPTIONS_CSV = f"market_data/{ticker}.csv"
-    df_full = pd.read_csv(OPTIONS_CSV)
-    df = df_full[df_full["date"]==date].copy()
+CONFIG = load_yaml("config/vol_surface.yaml")
+# filtres de get_data (config/vol_surface.yaml)
+FILTERS = {"max_iv": 1.5, "min_volume": 0, "min_open_interest": 10, "min_dte": 25, "max_dte": 200,
+           **CONFIG.get("filters", {})}
+
+
+def filter_options(df, max_iv=1.5, min_volume=0, min_open_interest=10, min_dte=25, max_dte=200):
+    # options liquides, OTM uniquement (puts sous le spot, calls au-dessus)
+    df = df.copy()
     df['daysToExpiration'] = (pd.to_datetime(df['expiration'])-pd.to_datetime(df['date']))/pd.Timedelta(days=1)
     df = df[
-    (df['iv'] < 1.5) &
-    (df["volume"] > 0) &
-    (df["open_interest"] > 10) &
-    (df["daysToExpiration"] > 25) &
-    (df["daysToExpiration"] < 200)
+    (df['iv'] < max_iv) &
+    (df["volume"] > min_volume) &
+    (df["open_interest"] > min_open_interest) &
+    (df["daysToExpiration"] > min_dte) &
+    (df["daysToExpiration"] < max_dte)
     ]
     df["k"] = np.log(df["strike"] / df["spot"])
     df = df[
@@ -28,46 +41,75 @@ def get_data(ticker, date):
     return df
 
 
+def get_data(ticker, date, **filters):
+    filters = {**FILTERS, **filters}
+    # seule la partition du jour est lue, échéances hors [min_dte, max_dte] écartées au niveau fichier
+    day = pd.Timestamp(date)
+    expiration = (day + pd.Timedelta(days=filters["min_dte"]), day + pd.Timedelta(days=filters["max_dte"]))
+    df = OptionStore().read(ticker, date=day, expiration=expiration)
+    return filter_options(df, **filters)
+
+
 def max_area_complete_grid(df):
-    adjK = defaultdict(set)
-    adjT = defaultdict(set)
+    """
+    Plus grand rectangle strikes x maturités entièrement coté, par retrait glouton
+    du strike ou de la maturité la plus incomplète.
+    Matrice de présence booléenne et compteurs mis à jour à chaque retrait ; les
+    égalités sont départagées dans l'ordre d'itération des ensembles de strikes et
+    de maturités (le même que l'ancienne version par ensembles, résultat identique).
+    """
+    strikes, k_idx = np.unique(df["strike"].to_numpy(), return_inverse=True)
+    days, t_idx = np.unique(df["daysToExpiration"].to_numpy(), return_inverse=True)
+    present = np.zeros((len(strikes), len(days)), dtype=bool)
+    present[k_idx, t_idx] = True
 
-    for _, r in df.iterrows():
-        adjK[r["strike"]].add(r["daysToExpiration"])
-        adjT[r["daysToExpiration"]].add(r["strike"])
+    # ensembles remplis dans l'ordre d'apparition, élément par élément : ordre d'itération
+    # de référence pour les égalités, inchangé par les retraits
+    K = set(pd.unique(df["strike"]).tolist())
+    T = set(pd.unique(df["daysToExpiration"]).tolist())
+    rank_k = np.empty(len(strikes), dtype=np.int64)
+    rank_k[np.searchsorted(strikes, list(K))] = np.arange(len(K))
+    rank_t = np.empty(len(days), dtype=np.int64)
+    rank_t[np.searchsorted(days, list(T))] = np.arange(len(T))
 
-    K = set(adjK)
-    T = set(adjT)
+    active_k = np.ones(len(strikes), dtype=bool)
+    active_t = np.ones(len(days), dtype=bool)
+    count_k = present.sum(axis=1)   # maturités actives cotées par strike
+    count_t = present.sum(axis=0)   # strikes actifs cotés par maturité
+    n_k, n_t = len(strikes), len(days)
 
     while True:
-        badK = [k for k in K if len(adjK[k] & T) < len(T)]
-        badT = [t for t in T if len(adjT[t] & K) < len(K)]
-
-        if not badK and not badT:
+        missing_k = np.where(active_k, n_t - count_k, 0)
+        missing_t = np.where(active_t, n_k - count_t, 0)
+        bad_k = missing_k.max(initial=0) > 0
+        bad_t = missing_t.max(initial=0) > 0
+        if not bad_k and not bad_t:
             break
 
         # aire si on supprime un strike ou une maturité
-        area_remove_k = (len(K) - 1) * len(T) if badK else -1
-        area_remove_t = len(K) * (len(T) - 1) if badT else -1
+        area_remove_k = (n_k - 1) * n_t if bad_k else -1
+        area_remove_t = n_k * (n_t - 1) if bad_t else -1
 
         if area_remove_k >= area_remove_t:
-            k = max(badK, key=lambda k: len(T) - len(adjK[k] & T))
-            K.remove(k)
+            candidates = np.flatnonzero(missing_k == missing_k.max())
+            i = candidates[np.argmin(rank_k[candidates])]
+            active_k[i] = False
+            count_t -= present[i] & active_t
+            K.remove(strikes[i].item())
+            n_k -= 1
         else:
-            t = max(badT, key=lambda t: len(K) - len(adjT[t] & K))
-            T.remove(t)
+            candidates = np.flatnonzero(missing_t == missing_t.max())
+            j = candidates[np.argmin(rank_t[candidates])]
+            active_t[j] = False
+            count_k -= present[:, j] & active_k
+            T.remove(days[j].item())
+            n_t -= 1
     return K, T
 
-def create_volatility_surface(options_data, interpolation):
+def complete_grid(options_data):
     K_active, T_active = max_area_complete_grid(options_data)
     options_grid = options_data[options_data["strike"].isin(K_active) & options_data["daysToExpiration"].isin(T_active)]
     spot = options_grid['spot'].iloc[-1]
-    print("nombre d'options:", len(options_grid))
-    print(len(K_active), "strikes")
-    print(np.log((options_grid["strike"].unique()/spot)).round(2))
-    print(len(T_active), "maturités")
-    print(options_grid["daysToExpiration"].unique())
-    
     surface = (
         options_grid[["daysToExpiration", "strike", "iv"]]
         .pivot_table(
@@ -78,24 +120,334 @@ def create_volatility_surface(options_data, interpolation):
     # Prepare interpolation data
     x = surface.columns.values
     y = np.log(surface.index.values/spot)
+    return x, y, surface.values, options_grid
+
+
+def fit_surface(x, y, Z, n_points=100, smoothing=0.1):
+    """ Spline lissée sur la grille complète, évaluée sur n_points maturités x n_points log-moneyness. """
     X, Y = np.meshgrid(x, y)
-    Z = surface.values
+    # Create interpolation points
+    x_new = np.linspace(x.min(), x.max(), n_points)
+    y_new = np.linspace(y.min(), y.max(), n_points)
 
-    if interpolation:   
-        # Create interpolation points
-        x_new = np.linspace(x.min(), x.max(), 100)
-        y_new = np.linspace(y.min(), y.max(), 100)
+    # Perform interpolation
+    spline = interpolate.SmoothBivariateSpline(
+        X.flatten(), Y.flatten(), Z.flatten(), s=smoothing
+    )
+    return x_new, y_new, spline(x_new, y_new).T
+
+
+def fit_parametric(options_data, method="svi", warm=None):
+    """ Surface SVI (une tranche par maturité) ou SSVI sur toutes les cotations filtrées. """
+    fit = svi.fit_ssvi if method == "ssvi" else svi.fit_svi
+    return fit(options_data["k"].to_numpy(), options_data["iv"].to_numpy(dtype=np.float64),
+               options_data["daysToExpiration"].to_numpy() / 365, warm=warm)
 
-        # Perform interpolation
-        spline = interpolate.SmoothBivariateSpline(
-            X.flatten(), Y.flatten(), Z.flatten(), s=0.1
-        )
-        X, Y = np.meshgrid(x_new, y_new)
-        Z = spline(x_new, y_new).T
 
+def parametric_grid(model, options_data, n_points=100):
+    # grille régulière sur les log-moneyness et maturités cotées, comme fit_surface
+    x_new = np.linspace(options_data["daysToExpiration"].min(), options_data["daysToExpiration"].max(), n_points)
+    y_new = np.linspace(options_data["k"].min(), options_data["k"].max(), n_points)
+    X, Y = np.meshgrid(x_new, y_new)
+    return x_new, y_new, model.implied_vol(Y, X / 365)
+
+
+def create_volatility_surface(options_data, interpolation, method=None):
+    method = method or CONFIG.get("method", "spline")
+    if method != "spline":
+        model = fit_parametric(options_data, method)
+        print("nombre d'options:", len(options_data))
+        print(len(model.T), "maturités ajustées", f"({method})")
+        print("arbitrages papillon / calendaires:", model.butterfly_violations().sum(), "/",
+              model.calendar_violations().sum())
+        x, y, Z = parametric_grid(model, options_data, CONFIG.get("n_points", 100))
+        X, Y = np.meshgrid(x, y)
+        return X, Y, Z, options_data
+
+    x, y, Z, options_grid = complete_grid(options_data)
+    spot = options_grid['spot'].iloc[-1]
+    print("nombre d'options:", len(options_grid))
+    print(len(y), "strikes")
+    print(np.log((options_grid["strike"].unique()/spot)).round(2))
+    print(len(x), "maturités")
+    print(options_grid["daysToExpiration"].unique())
+
+    if interpolation:
+        x, y, Z = fit_surface(x, y, Z)
+    X, Y = np.meshgrid(x, y)
     return X, Y, Z, options_grid
 
 
+###########################################
+# Surfaces de tout l'historique, en cache
+###########################################
+
+def _interp_axis(values, lo, hi, x):
+    """
+    values (n, ..., m) : une grille régulière [lo[i], hi[i]] de m points par ligne sur le
+    dernier axe. Interpolation linéaire en x[i] ligne par ligne, NaN hors de la grille.
+    """
+    m = values.shape[-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pos = (x - lo) / (hi - lo) * (m - 1)
+    inside = (pos >= 0) & (pos <= m - 1)
+    i = np.clip(np.floor(np.nan_to_num(pos)), 0, m - 2).astype(int)
+    w = np.nan_to_num(pos) - i
+    rows = np.arange(len(values))
+    shape = (-1,) + (1,) * (values.ndim - 2)
+    out = values[rows, ..., i] * (1 - w).reshape(shape) + values[rows, ..., i + 1] * w.reshape(shape)
+    return np.where(inside.reshape(shape), out, np.nan)
+
+
+class SurfaceHistory:
+    """
+    Surfaces lissées d'un ticker, une par date : iv[date, log-moneyness, maturité] sur des
+    grilles régulières k[date] x dte[date]. Skews, structures par terme et séries
+    (vol ATM, skew 25 delta) sont des lectures / interpolations dans ces tableaux.
+    """
+
+    def __init__(self, ticker, dates, dte, k, iv, spot, slice_T=None, slice_params=None, failed=None):
+        self.ticker = ticker
+        self.dates = pd.DatetimeIndex(dates)
+        self.dte, self.k, self.iv, self.spot = dte, k, iv, np.asarray(spot)
+        # surfaces SVI / SSVI : tranches (années) et paramètres SVI raw, complétés par NaN
+        self.slice_T, self.slice_params = slice_T, slice_params
+        # dates dont l'ajustement a échoué : pas réajustées tant que refresh=False
+        self.failed = pd.DatetimeIndex([] if failed is None else failed)
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def empty(cls, ticker, n_points):
+        return cls(ticker, [], np.empty((0, n_points)), np.empty((0, n_points)),
+                   np.empty((0, n_points, n_points), dtype=np.float32), np.empty(0))
+
+    @classmethod
+    def load(cls, path, ticker):
+        with np.load(path) as data:
+            slices = (data["slice_T"], data["slice_params"]) if "slice_T" in data else (None, None)
+            failed = data["failed"] if "failed" in data else None
+            return cls(ticker, data["dates"], data["dte"], data["k"], data["iv"], data["spot"], *slices, failed=failed)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        slices = {} if self.slice_T is None else {"slice_T": self.slice_T, "slice_params": self.slice_params}
+        np.savez_compressed(path, dates=self.dates.values.astype("datetime64[D]"),
+                            dte=self.dte, k=self.k, iv=self.iv, spot=self.spot,
+                            failed=self.failed.values.astype("datetime64[D]"), **slices)
+
+    def merge(self, other):
+        dates = self.dates.append(other.dates)
+        order = np.argsort(dates.values, kind="stable")
+        arrays = [np.concatenate([a, b])[order] for a, b in
+                  ((self.dte, other.dte), (self.k, other.k), (self.iv, other.iv), (self.spot, other.spot))]
+        if other.slice_T is not None:
+            # nombre de tranches variable d'une date à l'autre : complété par NaN
+            n = max(len(self.slice_T[0]) if len(self) else 0, other.slice_T.shape[1])
+            pad = lambda a: np.pad(a, [(0, 0), (0, n - a.shape[1])] + [(0, 0)] * (a.ndim - 2), constant_values=np.nan)
+            mine = (self.slice_T, self.slice_params) if self.slice_T is not None else \
+                (np.empty((0, n)), np.empty((0, n, 5)))
+            arrays += [np.concatenate([pad(mine[0]), pad(other.slice_T)])[order],
+                       np.concatenate([pad(mine[1]), pad(other.slice_params)])[order]]
+        failed = self.failed.union(other.failed).difference(dates)
+        return SurfaceHistory(self.ticker, dates[order], *arrays, failed=failed)
+
+    def model(self, date):
+        """ svi.SVISurface de la date (méthodes svi / ssvi uniquement). """
+        if self.slice_T is None:
+            raise ValueError("surfaces spline : pas de paramètres SVI stockés")
+        i = self._row(date)
+        ok = np.isfinite(self.slice_T[i])
+        return svi.SVISurface(self.slice_T[i, ok], self.slice_params[i, ok])
+
+    def iv_at(self, date, k, dte):
+        """ Vol implicite en (k, dte) quelconques : paramètres SVI si stockés, sinon grille. """
+        if self.slice_T is not None:
+            return self.model(date).implied_vol(k, np.asarray(dte) / 365)
+        i = self._row(date)
+        k, dte = np.broadcast_arrays(np.asarray(k, dtype=np.float64), np.asarray(dte, dtype=np.float64))
+        # bilinéaire sur la grille régulière de la date
+        grid = interpolate.RegularGridInterpolator((self.k[i], self.dte[i]), self.iv[i].astype(np.float64),
+                                                   bounds_error=False)
+        return grid(np.column_stack([k.ravel(), dte.ravel()])).reshape(k.shape)
+
+    def _row(self, date):
+        i = self.dates.get_indexer([pd.Timestamp(date)])[0]
+        if i < 0:
+            raise KeyError(f"pas de surface {self.ticker} au {date}")
+        return i
+
+    def surface(self, date):
+        # mêmes sorties que create_volatility_surface(..., interpolation=True)
+        i = self._row(date)
+        X, Y = np.meshgrid(self.dte[i], self.k[i])
+        return X, Y, self.iv[i].astype(np.float64)
+
+    def _slice_dte(self, dte):
+        # (dates, log-moneyness) à maturité constante
+        return _interp_axis(self.iv.astype(np.float64), self.dte[:, 0], self.dte[:, -1], np.full(len(self), float(dte)))
+
+    def skew(self, date, dte):
+        """ (log-moneyness, iv) à `dte` jours pour une date. """
+        i = self._row(date)
+        return self.k[i], self._slice_dte(dte)[i]
+
+    def term_structure(self, date, k=0.0):
+        """ (maturités, iv) à log-moneyness `k` pour une date. """
+        i = self._row(date)
+        by_dte = _interp_axis(self.iv.swapaxes(1, 2).astype(np.float64), self.k[:, 0], self.k[:, -1],
+                              np.full(len(self), float(k)))
+        return self.dte[i], by_dte[i]
+
+    def atm_iv(self, dte=30):
+        """ Série de la vol ATM (k = 0) à maturité constante. """
+        iv = _interp_axis(self._slice_dte(dte), self.k[:, 0], self.k[:, -1], np.zeros(len(self)))
+        return pd.Series(iv, index=self.dates, name=f"atm_iv_{dte}d")
+
+    def skew_25d(self, dte=30):
+        """
+        Série du skew 25 delta à maturité constante : iv(put 25d) - iv(call 25d).
+        Delta forward, taux nul : delta call = N(d1), d1 = (-k + iv² T / 2) / (iv sqrt(T)).
+        """
+        T = dte / 365
+        smile = self._slice_dte(dte)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            call_delta = norm_cdf((-self.k + smile**2 * T / 2) / (smile * np.sqrt(T)))
+        out = np.full(len(self), np.nan)
+        for i in range(len(self)):
+            ok = np.isfinite(call_delta[i])
+            if ok.sum() < 2:
+                continue
+            # le delta call décroît avec k : interpolation de l'iv en delta, axe inversé
+            delta, iv = call_delta[i, ok][::-1], smile[i, ok][::-1]
+            if not (delta[0] <= 0.25 and delta[-1] >= 0.75):
+                continue  # grille trop étroite pour contenir les deux strikes 25 delta
+            # put 25 delta = call 75 delta (delta forward)
+            out[i] = np.interp(0.75, delta, iv) - np.interp(0.25, delta, iv)
+        return pd.Series(out, index=self.dates, name=f"skew_25d_{dte}d")
+
+
+def surface_key(filters, n_points, smoothing, method="spline"):
+    # empreinte des paramètres : une entrée de cache par (ticker, paramètres), indexée par date
+    params = {"filters": filters, "n_points": n_points, "smoothing": smoothing}
+    if method != "spline":
+        params = {"filters": filters, "n_points": n_points, "method": method}
+    params = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(params.encode()).hexdigest()[:12]
+
+
+def load_history(ticker, filters, store=None, start=None):
+    """ Historique filtré d'un ticker à partir de `start`, en une lecture du store Parquet. """
+    store = store or OptionStore()
+    return filter_options(store.read(ticker, start=start), **filters)
+
+
+def _fit_day(job):
+    date, options, n_points, smoothing = job
+    try:
+        x, y, Z, options_grid = complete_grid(options)
+        x_new, y_new, Z_new = fit_surface(x, y, Z, n_points, smoothing)
+    except Exception as e:
+        return date, None, repr(e)
+    return date, (x_new, y_new, Z_new.astype(np.float32), options_grid["spot"].iloc[-1]), None
+
+
+def _fit_dates_parametric(job):
+    # dates d'un ticker dans l'ordre : chaque ajustement part des paramètres de la veille
+    days, n_points, method, warm = job
+    results = []
+    for date, options in days:
+        try:
+            model = fit_parametric(options, method, warm=warm)
+            x_new, y_new, Z = parametric_grid(model, options, n_points)
+        except Exception as e:
+            results.append((date, None, repr(e)))
+            continue
+        warm = model.ssvi if method == "ssvi" else (model.T, model.params)
+        results.append((date, (x_new, y_new, Z.astype(np.float32), options["spot"].iloc[-1], model.T, model.params), None))
+    return results
+
+
+def build_surfaces(tickers=None, workers=None, refresh=False, store=None, method=None, **filters):
+    """
+    Surfaces de toutes les dates stockées, pour chaque ticker : lecture de l'historique en
+    une fois, ajustement dans un pool de processus, puis cache .npz par (ticker, paramètres)
+    dans config cache_dir. Seules les dates absentes du cache sont ajustées ; les échecs y
+    sont aussi notés pour ne pas être réessayés (refresh=True pour tout recalculer).
+    Retourne {ticker: SurfaceHistory}.
+    method : "spline" (grille complète, une date par tâche) ou "svi" / "ssvi" (toutes les
+    cotations, une tâche par ticker pour enchaîner les dates à partir des paramètres de la veille).
+    """
+    store = store or OptionStore()
+    filters = {**FILTERS, **filters}
+    method = method or CONFIG.get("method", "spline")
+    n_points, smoothing = CONFIG.get("n_points", 100), CONFIG.get("smoothing", 0.1)
+    cache_dir = CONFIG.get("cache_dir", "output/vol_surfaces")
+    key = surface_key(filters, n_points, smoothing, method)
+    tickers = tickers or store.tickers()
+
+    histories, paths, jobs = {}, {}, []
+    failed = {ticker: [] for ticker in tickers}
+    for ticker in tickers:
+        paths[ticker] = os.path.join(cache_dir, f"{ticker}_{key}.npz")
+        histories[ticker] = SurfaceHistory.load(paths[ticker], ticker) \
+            if os.path.exists(paths[ticker]) and not refresh else SurfaceHistory.empty(ticker, n_points)
+        known = histories[ticker].dates.union(histories[ticker].failed)
+        # le store liste ses partitions : on ne relit que les dates absentes du cache
+        missing = [date for date in store.dates(ticker) if date not in known]
+        if not missing:
+            continue
+        start = missing[0]
+        options = load_history(ticker, filters, store, start=start)
+        columns = ["strike", "daysToExpiration", "k", "iv", "spot"]
+        days = [(date, day[columns]) for date, day in options.groupby("date", sort=True)
+                if date not in known]
+        # partitions sans cotation retenue par les filtres : notées comme échecs
+        failed[ticker] += sorted(set(missing) - {date for date, _ in days})
+        if method == "spline":
+            jobs += [((ticker,), (date, day, n_points, smoothing)) for date, day in days]
+        elif days:
+            history = histories[ticker]
+            warm = None
+            if method == "svi" and history.slice_T is not None and len(history):
+                last = history.model(history.dates[-1])
+                warm = (last.T, last.params)
+            jobs.append(((ticker,) * len(days), (days, n_points, method, warm)))
+
+    fitted = {ticker: [] for ticker in tickers}
+    if jobs:
+        fit = _fit_day if method == "spline" else _fit_dates_parametric
+        with ProcessPoolExecutor(max_workers=workers or CONFIG.get("workers")) as pool:
+            results = pool.map(fit, [job for _, job in jobs], chunksize=max(1, len(jobs) // 64))
+            for (owners, _), result in zip(jobs, results):
+                for ticker, (date, surface, error) in zip(owners, [result] if method == "spline" else result):
+                    if surface is None:
+                        failed[ticker].append(date)
+                    else:
+                        fitted[ticker].append((date, surface))
+    n_failed = sum(len(dates) for dates in failed.values())
+    if n_failed:
+        print(f"{n_failed} dates sans surface ({method} : pas assez de cotations)")
+
+    for ticker, fits in fitted.items():
+        if failed[ticker]:
+            histories[ticker].failed = histories[ticker].failed.union(pd.DatetimeIndex(failed[ticker]))
+        if fits:
+            arrays = [np.stack([surface[i] for _, surface in fits]) for i in range(3)]
+            slices = []
+            if method != "spline":
+                n = max(len(surface[4]) for _, surface in fits)
+                slices = [np.stack([np.pad(surface[4], (0, n - len(surface[4])), constant_values=np.nan) for _, surface in fits]),
+                          np.stack([np.pad(surface[5], [(0, n - len(surface[5])), (0, 0)], constant_values=np.nan)
+                                    for _, surface in fits])]
+            new = SurfaceHistory(ticker, [date for date, _ in fits], *arrays, [surface[3] for _, surface in fits], *slices)
+            histories[ticker] = histories[ticker].merge(new)
+        if fits or failed[ticker]:
+            histories[ticker].save(paths[ticker])
+    return histories
+
+
 def plot_volatility_surface(X, Y, Z, vmin=0.2, vmax=0.6):
     plt.style.use("default")
     sns.set_style("whitegrid", {"axes.grid": False})